@@ -0,0 +1,121 @@
+"""
+Static asset build and serving
+
+`python -m app.assets` minifies static/js/*.js into static/dist/js/<name>.<hash>.js
+with precompressed .br/.gz siblings, and writes static/dist/manifest.json
+mapping the source URLs to the built ones. Pages are rewritten with the
+manifest when the shell is loaded (app/render.py), so they reference the hashed
+files, which never change and are served with immutable caching. Without a
+build, the sources are served and revalidated on each use.
+"""
+import os
+import sys
+import json
+import shutil
+import hashlib
+from typing import Dict
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.types import Scope
+
+from app.compression import accepted_encodings, brotli, compress
+
+# Project root (parent of backend directory), holding the page shell and static/
+backend_dir = os.path.dirname(os.path.dirname(__file__))
+PROJECT_DIR = os.path.dirname(backend_dir) if os.path.basename(backend_dir) == "backend" else backend_dir
+STATIC_DIR = os.path.join(PROJECT_DIR, "static")
+DIST_DIR = os.path.join(STATIC_DIR, "dist")
+MANIFEST_PATH = os.path.join(DIST_DIR, "manifest.json")
+STATIC_URL = "/static"
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+
+# Precompressed siblings, by order of preference
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+
+
+def _minify(source: str) -> str:
+    import rjsmin  # build dependency only
+    return rjsmin.jsmin(source)
+
+
+def build(static_dir: str = STATIC_DIR) -> Dict[str, str]:
+    """Build the hashed, minified and precompressed scripts, return the manifest"""
+    dist_dir = os.path.join(static_dir, "dist")
+    shutil.rmtree(dist_dir, ignore_errors=True)
+    os.makedirs(os.path.join(dist_dir, "js"))
+    manifest = {}
+    source_dir = os.path.join(static_dir, "js")
+    for name in sorted(os.listdir(source_dir)):
+        if not name.endswith(".js"):
+            continue
+        with open(os.path.join(source_dir, name), encoding="utf-8") as f:
+            data = _minify(f.read()).encode()
+        built = f"{name[:-3]}.{hashlib.sha256(data).hexdigest()[:10]}.js"
+        path = os.path.join(dist_dir, "js", built)
+        with open(path, "wb") as f:
+            f.write(data)
+        with open(path + ".gz", "wb") as f:
+            f.write(compress(data, "gzip", 9))
+        if brotli is not None:
+            with open(path + ".br", "wb") as f:
+                f.write(compress(data, "br", 11))
+        manifest[f"{STATIC_URL}/js/{name}"] = f"{STATIC_URL}/dist/js/{built}"
+    with open(os.path.join(dist_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+_manifest = {"mtime": None, "urls": {}}
+
+
+def load_manifest() -> Dict[str, str]:
+    """Source URL -> built URL, empty without a build (reread when the build changes)"""
+    try:
+        mtime = os.stat(MANIFEST_PATH).st_mtime
+    except OSError:
+        mtime = None
+    if mtime != _manifest["mtime"]:
+        urls = {}
+        if mtime is not None:
+            with open(MANIFEST_PATH, encoding="utf-8") as f:
+                urls = json.load(f)
+        _manifest.update(mtime=mtime, urls=urls)
+    return _manifest["urls"]
+
+
+def rewrite_urls(page: str, manifest: Dict[str, str]) -> str:
+    """Point the quoted asset URLs of a page to their built version"""
+    for source, built in manifest.items():
+        page = page.replace(f'"{source}"', f'"{built}"')
+    return page
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles serving the .br/.gz sibling of a file when the client accepts it,
+    with immutable caching for the built (hashed) files"""
+
+    async def get_response(self, path: str, scope: Scope):
+        response = None
+        accepted = accepted_encodings(Headers(scope=scope))
+        for encoding, suffix in PRECOMPRESSED:
+            if encoding in accepted:
+                try:
+                    response = await super().get_response(path + suffix, scope)
+                except HTTPException:
+                    continue
+                response.headers["Content-Encoding"] = encoding
+                break
+        if response is None:
+            response = await super().get_response(path, scope)
+        hashed = path.startswith("dist/") and not path.endswith("manifest.json")
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL if hashed else REVALIDATE_CACHE_CONTROL
+        response.headers["Vary"] = "Accept-Encoding"
+        return response
+
+
+if __name__ == "__main__":
+    static_dir = sys.argv[1] if len(sys.argv) > 1 else STATIC_DIR
+    print(f"{len(build(static_dir))} scripts built in {os.path.join(static_dir, 'dist')}")
@@ -0,0 +1,276 @@
+"""
+Response cache for public read endpoints
+
+Entries are serialized JSON bodies tagged with the data they were built from
+("articles", "article:3", "spot:7", "comments:article:3"...). Committed ORM changes invalidate the tags
+of the rows they touch; bulk statements that bypass the ORM call
+response_cache.invalidate() themselves.
+
+An entry built while one of its tags gets invalidated is not stored: it may
+have been read before the change. set() takes the generation() read before
+building and skips the write if a tag was invalidated since.
+
+Backends: MemoryCache (per-process LRU with TTL) and SharedCache, which works on
+top of any KeyValueStore (get/set with TTL and incr, e.g. Redis) and invalidates
+by bumping tag versions so every process sees it. LocalStore is an in-process
+stand-in for such a store.
+"""
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Protocol, Set, Union
+from fastapi import Response
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.models import Article, Spot, User, Comment
+from app.serialization import dumps
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")  # memory, shared or none
+CACHE_TTL = float(os.getenv("CACHE_TTL", "60"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1000"))
+
+
+class CacheBackend:
+    """Interface of a response cache"""
+
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes, tags: Iterable[str] = (), ttl: float = CACHE_TTL,
+            since: Optional[int] = None) -> None:
+        """Store an entry, unless one of its tags was invalidated after generation `since`"""
+        raise NotImplementedError
+
+    def generation(self) -> int:
+        """Counter of invalidations, to pass to set() as `since`"""
+        raise NotImplementedError
+
+    def invalidate(self, *tags: str) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+
+class NullCache(CacheBackend):
+    """Cache disabled"""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, tags=(), ttl=CACHE_TTL, since=None):
+        pass
+
+    def generation(self):
+        return 0
+
+    def invalidate(self, *tags):
+        pass
+
+    def clear(self):
+        pass
+
+
+class MemoryCache(CacheBackend):
+    """Per-process LRU cache bounded in entries, with TTL and tag invalidation"""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, value, tags)
+        self._tags: Dict[str, Set[str]] = {}
+        self._generation = 0
+        self._invalidated: Dict[str, int] = {}  # tag -> generation of its last invalidation ("*": clear)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, tags=(), ttl=CACHE_TTL, since=None):
+        with self._lock:
+            tags = tuple(tags)
+            if since is not None and any(self._invalidated.get(t, 0) > since for t in ("*", *tags)):
+                return
+            self._drop(key)
+            self._entries[key] = (time.monotonic() + ttl, value, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def generation(self):
+        return self._generation
+
+    def invalidate(self, *tags):
+        with self._lock:
+            self._generation += 1
+            for tag in tags:
+                self._invalidated[tag] = self._generation
+                for key in self._tags.pop(tag, ()):
+                    self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self._generation += 1
+            self._invalidated = {"*": self._generation}
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry:
+            for tag in entry[2]:
+                keys = self._tags.get(tag)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._tags[tag]
+
+
+class KeyValueStore(Protocol):
+    """Minimal interface of a shared store"""
+
+    def get(self, key: str) -> Optional[bytes]: ...
+
+    def set(self, key: str, value: bytes, ttl: float) -> None: ...
+
+    def incr(self, key: str) -> int: ...
+
+
+class LocalStore:
+    """In-process KeyValueStore, stand-in for a shared store"""
+
+    def __init__(self):
+        self._data: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None or (entry[0] is not None and entry[0] < time.monotonic()):
+            return None
+        return entry[1]
+
+    def set(self, key, value, ttl):
+        self._data[key] = (time.monotonic() + ttl, value)
+
+    def incr(self, key):
+        with self._lock:
+            value = int(self.get(key) or 0) + 1
+            self._data[key] = (None, str(value).encode())
+            return value
+
+
+class SharedCache(CacheBackend):
+    """Cache over a KeyValueStore; a tag is invalidated by bumping its version,
+    which changes the storage key of every entry built with it. The generation of
+    its last invalidation is kept for CACHE_TTL, longer than a build takes"""
+
+    def __init__(self, store: KeyValueStore):
+        self.store = store
+
+    def _versioned(self, key, tags):
+        versions = ",".join((self.store.get(f"tag:{t}") or b"0").decode() for t in ["*", *tags])
+        return f"entry:{key}@{versions}"
+
+    def get(self, key):
+        tags = self.store.get(f"tags:{key}")
+        if tags is None:
+            return None
+        return self.store.get(self._versioned(key, json.loads(tags)))
+
+    def set(self, key, value, tags=(), ttl=CACHE_TTL, since=None):
+        tags = list(tags)
+        if since is not None and any(int(self.store.get(f"invalidated:{t}") or 0) > since for t in ["*", *tags]):
+            return
+        self.store.set(f"tags:{key}", json.dumps(tags).encode(), ttl)
+        self.store.set(self._versioned(key, tags), value, ttl)
+
+    def generation(self):
+        return int(self.store.get("generation") or 0)
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            self.store.incr(f"tag:{tag}")
+            self.store.set(f"invalidated:{tag}", str(self.store.incr("generation")).encode(), CACHE_TTL)
+
+    def clear(self):
+        self.invalidate("*")
+
+
+def _make_backend() -> CacheBackend:
+    if CACHE_BACKEND == "none":
+        return NullCache()
+    if CACHE_BACKEND == "shared":
+        return SharedCache(LocalStore())
+    return MemoryCache()
+
+
+response_cache: CacheBackend = _make_backend()
+
+
+def cache_key(prefix: str, params) -> str:
+    """Key of an entry from an endpoint prefix and its query parameters"""
+    return prefix + "?" + "&".join(f"{k}={v}" for k, v in sorted(params.multi_items()))
+
+
+Tags = Union[Iterable[str], Callable[[Any], Iterable[str]]]
+
+
+async def get_or_build(key: str, tags: Tags, build: Callable[[], Awaitable[Any]]) -> bytes:
+    """Cached JSON body, built and stored on a miss (tags may be computed from the built data)"""
+    body = response_cache.get(key)
+    if body is None:
+        generation = response_cache.generation()
+        data = await build()
+        body = dumps(data)
+        response_cache.set(key, body, tags(data) if callable(tags) else tags, since=generation)
+    return body
+
+
+async def cached_json(key: str, tags: Tags, build: Callable[[], Awaitable[Any]]) -> Response:
+    """JSON response served from the cache"""
+    return Response(content=await get_or_build(key, tags, build), media_type="application/json")
+
+
+# Tags touched by a change to a row
+def _tags_for(obj) -> Set[str]:
+    if isinstance(obj, Article):
+        return {"articles", f"article:{obj.id}"}
+    if isinstance(obj, Spot):
+        return {"spots", f"spot:{obj.id}"}
+    if isinstance(obj, Comment):
+        return {f"comments:article:{obj.article_id}"}
+    if isinstance(obj, User):
+        state = inspect(obj)
+        if state.deleted or state.attrs.full_name.history.has_changes() or state.attrs.username.history.has_changes():
+            return {"articles", f"author:{obj.id}"}
+    return set()
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_tags(session, flush_context):
+    tags = session.info.setdefault("cache_tags", set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        tags |= _tags_for(obj)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session):
+    tags = session.info.pop("cache_tags", None)
+    if tags:
+        response_cache.invalidate(*tags)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session):
+    session.info.pop("cache_tags", None)
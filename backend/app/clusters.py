@@ -0,0 +1,104 @@
+"""
+Precomputed marker clusters for the spots map
+
+Each zoom level is split into a Web Mercator grid of CELLS_PER_TILE x CELLS_PER_TILE
+cells per map tile. spot_clusters holds, for every non-empty cell, the number of
+spots and the sums of their coordinates; ORM events on Spot update the cells
+incrementally, so reading the clusters of a viewport never touches the spots table.
+"""
+import math
+from typing import Dict, List, Tuple
+from sqlalchemy import event, inspect, select, update, insert, delete, and_, or_
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Spot, SpotCluster
+from app.geo import BBox
+from app.utils import upsert_add
+
+CELLS_PER_TILE = 4
+MAX_CLUSTER_ZOOM = 16
+MAX_MERCATOR_LAT = 85.05112878
+
+clusters = SpotCluster.__table__
+
+
+def grid_size(zoom: int) -> int:
+    return CELLS_PER_TILE << zoom
+
+
+def cell_x(lon: float, zoom: int) -> int:
+    n = grid_size(zoom)
+    return min(n - 1, max(0, int((lon + 180.0) / 360.0 * n)))
+
+
+def cell_y(lat: float, zoom: int) -> int:
+    n = grid_size(zoom)
+    lat = math.radians(max(-MAX_MERCATOR_LAT, min(MAX_MERCATOR_LAT, lat)))
+    return min(n - 1, max(0, int((1 - math.asinh(math.tan(lat)) / math.pi) / 2 * n)))
+
+
+def _add(conn: Connection, lat: float, lon: float, sign: int) -> None:
+    """Add (sign=1) or remove (sign=-1) a point from its cell at every zoom level"""
+    for zoom in range(MAX_CLUSTER_ZOOM + 1):
+        cell = {"zoom": zoom, "cell_x": cell_x(lon, zoom), "cell_y": cell_y(lat, zoom)}
+        if sign > 0:
+            upsert_add(conn, clusters, cell, {"count": 1, "lat_sum": lat, "lon_sum": lon})
+            continue
+        key = and_(*(clusters.c[name] == value for name, value in cell.items()))
+        conn.execute(update(clusters).where(key).values(
+            count=clusters.c.count - 1, lat_sum=clusters.c.lat_sum - lat, lon_sum=clusters.c.lon_sum - lon
+        ))
+        conn.execute(delete(clusters).where(key, clusters.c.count <= 0))
+
+
+def rebuild(conn: Connection) -> None:
+    """Recompute every cell from the spots table"""
+    cells: Dict[Tuple[int, int, int], List[float]] = {}
+    for lat, lon in conn.execute(select(Spot.latitude, Spot.longitude)):
+        for zoom in range(MAX_CLUSTER_ZOOM + 1):
+            cell = cells.setdefault((zoom, cell_x(lon, zoom), cell_y(lat, zoom)), [0, 0.0, 0.0])
+            cell[0] += 1
+            cell[1] += lat
+            cell[2] += lon
+    conn.execute(delete(clusters))
+    if cells:
+        conn.execute(insert(clusters), [
+            {"zoom": z, "cell_x": x, "cell_y": y, "count": c, "lat_sum": la, "lon_sum": lo}
+            for (z, x, y), (c, la, lo) in cells.items()
+        ])
+
+
+async def get_clusters(db: AsyncSession, bbox: BBox, zoom: int, limit: int) -> List[dict]:
+    """Clusters of a viewport: centroid and number of spots per non-empty cell"""
+    zoom = min(zoom, MAX_CLUSTER_ZOOM)
+    min_lon, min_lat, max_lon, max_lat = bbox
+    lon_ranges = [(min_lon, max_lon)] if min_lon <= max_lon else [(min_lon, 180.0), (-180.0, max_lon)]
+    rows = await db.execute(select(clusters).where(
+        clusters.c.zoom == zoom,
+        or_(*(clusters.c.cell_x.between(cell_x(lo, zoom), cell_x(hi, zoom)) for lo, hi in lon_ranges)),
+        clusters.c.cell_y.between(cell_y(max_lat, zoom), cell_y(min_lat, zoom))
+    ).limit(limit))
+    return [{"lat": r.lat_sum / r.count, "lon": r.lon_sum / r.count, "count": r.count} for r in rows]
+
+
+def remove_points(conn: Connection, points) -> None:
+    """Take (lat, lon) points out of their cells, for deletes that bypass the ORM"""
+    for lat, lon in points:
+        _add(conn, lat, lon, -1)
+
+
+def _after_update(mapper, conn, target):
+    state = inspect(target)
+    lat, lon = state.attrs.latitude.history, state.attrs.longitude.history
+    if not (lat.deleted or lon.deleted):
+        return
+    old_lat = lat.deleted[0] if lat.deleted else target.latitude
+    old_lon = lon.deleted[0] if lon.deleted else target.longitude
+    _add(conn, old_lat, old_lon, -1)
+    _add(conn, target.latitude, target.longitude, 1)
+
+
+event.listen(Spot, "after_insert", lambda mapper, conn, target: _add(conn, target.latitude, target.longitude, 1))
+event.listen(Spot, "after_update", _after_update)
+event.listen(Spot, "after_delete", lambda mapper, conn, target: _add(conn, target.latitude, target.longitude, -1))
@@ -0,0 +1,125 @@
+"""
+Response compression
+
+CompressionMiddleware compresses text responses (JSON, HTML, JS, CSS...) of at
+least COMPRESS_MIN_SIZE bytes with brotli when the client accepts it and the
+brotli package is installed, with gzip otherwise. Responses that already carry
+a Content-Encoding (precompressed static files) are left as they are.
+"""
+import os
+import zlib
+from typing import Optional, Set
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # optional, gzip only
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "500"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))  # dynamic responses; 11 for built assets
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "application/xml", "image/svg+xml")
+
+
+def accepted_encodings(headers: Headers) -> Set[str]:
+    """Encodings of Accept-Encoding, minus those refused with q=0"""
+    accepted = set()
+    for item in headers.get("accept-encoding", "").split(","):
+        name, *params = (p.strip() for p in item.split(";"))
+        quality = next((p[2:] for p in params if p.startswith("q=")), "1")
+        try:
+            if name and float(quality) > 0:
+                accepted.add(name.lower())
+        except ValueError:
+            pass
+    return accepted
+
+
+def preferred_encoding(headers: Headers) -> Optional[str]:
+    """Best encoding available for a request, None for identity"""
+    accepted = accepted_encodings(headers)
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+class _Compressor:
+    """Streaming compressor of an encoding"""
+
+    def __init__(self, encoding: str, level: Optional[int] = None):
+        if encoding == "br":
+            self._obj = brotli.Compressor(quality=BROTLI_QUALITY if level is None else level)
+            self._compress, self._finish = self._obj.process, self._obj.finish
+        else:
+            self._obj = zlib.compressobj(GZIP_LEVEL if level is None else level, zlib.DEFLATED, 31)  # 31: gzip header
+            self._compress, self._finish = self._obj.compress, self._obj.flush
+
+    def compress(self, data: bytes, final: bool = False) -> bytes:
+        return self._compress(data) + (self._finish() if final else b"")
+
+
+def compress(data: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    """Compress a whole body"""
+    return _Compressor(encoding, level).compress(data, final=True)
+
+
+class CompressionMiddleware:
+    """Compress text responses of at least minimum_size bytes (streamed responses always)"""
+
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESS_MIN_SIZE) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        encoding = preferred_encoding(Headers(scope=scope)) if scope["type"] == "http" else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await _Responder(self.app, encoding, self.minimum_size)(scope, receive, send)
+
+
+class _Responder:
+    def __init__(self, app: ASGIApp, encoding: str, minimum_size: int) -> None:
+        self.app = app
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start_message: Optional[Message] = None
+        self.compressor: Optional[_Compressor] = None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            # Held back until the first body chunk tells whether to compress
+            self.start_message = message
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+        body, more_body = message.get("body", b""), message.get("more_body", False)
+        if self.start_message is not None:
+            start, self.start_message = self.start_message, None
+            headers = MutableHeaders(raw=start["headers"])
+            compressible = "content-encoding" not in headers and headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+            if compressible and "accept-encoding" not in headers.get("vary", "").lower():
+                headers.add_vary_header("Accept-Encoding")
+            if compressible and (more_body or len(body) >= self.minimum_size):
+                self.compressor = _Compressor(self.encoding)
+                body = self.compressor.compress(body, final=not more_body)
+                headers["Content-Encoding"] = self.encoding
+                if more_body:
+                    if "content-length" in headers:
+                        del headers["content-length"]
+                else:
+                    headers["Content-Length"] = str(len(body))
+            await self.send(start)
+        elif self.compressor is not None:
+            body = self.compressor.compress(body, final=not more_body)
+        await self.send({"type": "http.response.body", "body": body, "more_body": more_body})
@@ -0,0 +1,95 @@
+"""
+HTTP conditional requests (ETag / Last-Modified / 304) and Cache-Control
+
+Detail validators come from the row itself (its version, bumped by every
+update, since timestamps have a one-second resolution on SQLite), so a 304 is
+answered before the body is built or serialized. List ETags are weak and hash the body, which
+usually comes from the response cache: no query runs for a revalidation of a
+cached list. Lists carry no Last-Modified since a deletion does not move
+max(updated_at).
+"""
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+from fastapi import Request, Response
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Revalidated on each use (a 304 is cheap), so the admin screens, which read the
+# public endpoints, see their changes at once
+LIST_CACHE_CONTROL = "public, no-cache"
+DETAIL_CACHE_CONTROL = "public, no-cache"
+PRIVATE_CACHE_CONTROL = "private, no-store"
+
+
+class Validators:
+    """ETag / Last-Modified of a resource and the Cache-Control of its route"""
+
+    def __init__(self, etag: str, last_modified: Optional[datetime] = None, cache_control: str = LIST_CACHE_CONTROL):
+        self.etag = etag
+        if last_modified is not None:
+            # Naive values are stored in UTC (SQLite CURRENT_TIMESTAMP)
+            last_modified = last_modified.replace(tzinfo=timezone.utc) if last_modified.tzinfo is None else last_modified.astimezone(timezone.utc)
+            last_modified = last_modified.replace(microsecond=0)
+        self.last_modified = last_modified
+        self.cache_control = cache_control
+
+    def matches(self, request: Request) -> bool:
+        """True if the client copy is still valid (If-None-Match takes precedence over If-Modified-Since)"""
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = [_opaque(t.strip()) for t in if_none_match.split(",")]
+            return "*" in tags or _opaque(self.etag) in tags
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since and self.last_modified:
+            try:
+                return self.last_modified <= parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def apply(self, response: Response) -> Response:
+        """Set the validators and Cache-Control on a response"""
+        response.headers["ETag"] = self.etag
+        response.headers["Cache-Control"] = self.cache_control
+        if self.last_modified:
+            response.headers["Last-Modified"] = format_datetime(self.last_modified, usegmt=True)
+        return response
+
+    def not_modified(self) -> Response:
+        return self.apply(Response(status_code=304))
+
+
+def _opaque(etag: str) -> str:
+    """ETag without its weak prefix (If-None-Match uses weak comparison)"""
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def _digest(*parts) -> str:
+    return hashlib.sha1("|".join(map(str, parts)).encode()).hexdigest()
+
+
+def list_response(request: Request, response: Response, cache_control: str = LIST_CACHE_CONTROL) -> Response:
+    """A list response with an ETag hashing its body, or a 304 when the client copy is current"""
+    validators = Validators(f'W/"{hashlib.sha1(response.body).hexdigest()}"', cache_control=cache_control)
+    if validators.matches(request):
+        return validators.not_modified()
+    return validators.apply(response)
+
+
+async def row_validators(db: AsyncSession, model, condition, *extra_columns, cache_control: str = DETAIL_CACHE_CONTROL):
+    """(id, validators) of the row matching condition, or None if there is none"""
+    row = (await db.execute(select(
+        model.id, func.coalesce(model.updated_at, model.created_at), model.version, *extra_columns
+    ).where(condition))).first()
+    if row is None:
+        return None
+    return row[0], Validators(f'W/"{_digest(model.__tablename__, *row)}"', row[1], cache_control)
+
+
+def cache_control(value: str):
+    """Dependency setting Cache-Control on every response of a router"""
+    def set_header(response: Response):
+        response.headers["Cache-Control"] = value
+    return set_header
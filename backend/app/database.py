@@ -1,27 +1,97 @@
 """
 Database configuration and session management
 """
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from typing import AsyncIterator, Dict
 import os
 
+from app.metrics import instrument_engine
+
 # Database URL (SQLite for development, can be changed to PostgreSQL for production)
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./lumière.db")
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
-)
+# Async driver for the same database (aiosqlite / asyncpg)
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg", "postgres": "postgresql+asyncpg"}
+scheme, _, rest = DATABASE_URL.partition("://")
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", f"{ASYNC_DRIVERS.get(scheme.split('+')[0], scheme)}://{rest}")
+
+# Connection pool (in-memory SQLite keeps SQLAlchemy's single-connection pool)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+# PRAGMAs run on every new SQLite connection: WAL lets readers proceed while the
+# view counter writes, busy_timeout waits for the write lock instead of failing
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536")),  # negative: KiB
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000")),  # ms
+}
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def create_db_engine(url: str, asynchronous: bool = False):
+    """Engine configured from the settings above (sync, or async for request handlers)"""
+    is_sqlite = url.startswith("sqlite")
+    options = {"pool_recycle": DB_POOL_RECYCLE, "pool_pre_ping": DB_POOL_PRE_PING}
+    if is_sqlite and not asynchronous:
+        options["connect_args"] = {"check_same_thread": False}
+    if not (is_sqlite and (":memory:" in url or url.partition("://")[2] in ("", "/"))):
+        options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+        if is_sqlite and asynchronous:
+            # aiosqlite defaults to NullPool, which reconnects (and reruns the PRAGMAs) per request
+            options["poolclass"] = AsyncAdaptedQueuePool
+    new_engine = (create_async_engine if asynchronous else create_engine)(url, **options)
+    if is_sqlite:
+        event.listen(new_engine.sync_engine if asynchronous else new_engine, "connect", _set_sqlite_pragmas)
+    return new_engine
+
+
+def _pool_stats(bind: Engine) -> Dict[str, object]:
+    pool = bind.pool
+    stats = {"pool": type(pool).__name__}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        if callable(getattr(pool, name, None)):
+            stats[name] = getattr(pool, name)()
+    return stats
+
+
+def pool_stats() -> Dict[str, Dict[str, object]]:
+    """Connection pool usage of both engines (for monitoring)"""
+    return {"sync": _pool_stats(engine), "async": _pool_stats(async_engine.sync_engine)}
+
+
+# Sync engine: migrations, scripts and background jobs (view counter)
+engine = create_db_engine(DATABASE_URL)
+
+# Async engine: request handlers
+async_engine = create_db_engine(ASYNC_DATABASE_URL, asynchronous=True)
+
+# Statement timing, per request and in /api/metrics
+instrument_engine(engine, "sync")
+instrument_engine(async_engine.sync_engine, "async")
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
-def get_db():
-    """Dependency for getting database session"""
-    db = SessionLocal()
-    try:
+async def get_db() -> AsyncIterator[AsyncSession]:
+    """Dependency for getting an async database session"""
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
@@ -0,0 +1,109 @@
+"""
+Spatial queries on spots
+
+SQLite keeps an R-tree virtual table (spots_rtree) in sync with the spots through
+ORM events; other databases use the B-tree index on (latitude, longitude).
+"""
+import math
+from typing import Tuple
+from fastapi import HTTPException
+from sqlalchemy import event, text, select, and_, or_, Integer
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Spot
+
+EARTH_RADIUS_KM = 6371.0088
+
+# (min_lon, min_lat, max_lon, max_lat)
+BBox = Tuple[float, float, float, float]
+
+
+def parse_bbox(value: str) -> BBox:
+    """Parse 'minLon,minLat,maxLon,maxLat', raise 400 if invalid"""
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(v) for v in value.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox must be minLon,minLat,maxLon,maxLat")
+    if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lon <= 180 and -180 <= max_lon <= 180):
+        raise HTTPException(status_code=400, detail="bbox out of range")
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def parse_point(value: str) -> Tuple[float, float]:
+    """Parse 'lat,lon', raise 400 if invalid"""
+    try:
+        lat, lon = (float(v) for v in value.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="near must be lat,lon")
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise HTTPException(status_code=400, detail="near out of range")
+    return lat, lon
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two points"""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bbox_around(lat: float, lon: float, radius_km: float) -> BBox:
+    """Smallest bbox containing the circle (may wrap around the antimeridian)"""
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat, max_lat = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+    cos_lat = math.cos(math.radians(max(abs(min_lat), abs(max_lat))))
+    dlon = 180.0 if cos_lat < 1e-9 else math.degrees(radius_km / (EARTH_RADIUS_KM * cos_lat))
+    if dlon >= 180:
+        return -180.0, min_lat, 180.0, max_lat
+    wrap = lambda x: (x + 180) % 360 - 180
+    return wrap(lon - dlon), min_lat, wrap(lon + dlon), max_lat
+
+
+def bbox_filter(db: AsyncSession, bbox: BBox):
+    """Filter expression keeping spots inside a bbox (min_lon > max_lon crosses the antimeridian)"""
+    min_lon, min_lat, max_lon, max_lat = bbox
+    lon_ranges = [(min_lon, max_lon)] if min_lon <= max_lon else [(min_lon, 180.0), (-180.0, max_lon)]
+    exact = and_(
+        Spot.latitude.between(min_lat, max_lat),
+        or_(*(Spot.longitude.between(lo, hi) for lo, hi in lon_ranges))
+    )
+    if db.get_bind().dialect.name == "sqlite":
+        # The R-tree stores float32 bounds rounded outwards, the exact test runs on its candidates only
+        clauses = [text(
+            f"SELECT id FROM spots_rtree WHERE min_lat <= :max_lat{i} AND max_lat >= :min_lat{i} "
+            f"AND min_lon <= :max_lon{i} AND max_lon >= :min_lon{i}"
+        ).bindparams(**{f"min_lat{i}": min_lat, f"max_lat{i}": max_lat, f"min_lon{i}": lo, f"max_lon{i}": hi})
+            for i, (lo, hi) in enumerate(lon_ranges)]
+        return and_(or_(*(Spot.id.in_(select(c.columns(id=Integer).subquery().c.id)) for c in clauses)), exact)
+    return exact
+
+
+def create_index(conn: Connection) -> None:
+    """Create and fill the R-tree on SQLite"""
+    if conn.dialect.name != "sqlite":
+        return
+    conn.execute(text("CREATE VIRTUAL TABLE IF NOT EXISTS spots_rtree USING rtree(id, min_lat, max_lat, min_lon, max_lon)"))
+    conn.execute(text("DELETE FROM spots_rtree"))
+    conn.execute(text("INSERT INTO spots_rtree SELECT id, latitude, latitude, longitude, longitude FROM spots"))
+
+
+def index_spot(conn: Connection, spot: Spot) -> None:
+    """Add or move a spot in the R-tree"""
+    if conn.dialect.name == "sqlite":
+        conn.execute(
+            text("INSERT OR REPLACE INTO spots_rtree VALUES (:id, :lat, :lat, :lon, :lon)"),
+            {"id": spot.id, "lat": spot.latitude, "lon": spot.longitude}
+        )
+
+
+def remove_spots(conn: Connection, spot_ids) -> None:
+    """Remove spots from the R-tree"""
+    spot_ids = list(spot_ids)
+    if spot_ids and conn.dialect.name == "sqlite":
+        conn.execute(text("DELETE FROM spots_rtree WHERE id = :id"), [{"id": i} for i in spot_ids])
+
+
+event.listen(Spot, "after_insert", lambda mapper, conn, target: index_spot(conn, target))
+event.listen(Spot, "after_update", lambda mapper, conn, target: index_spot(conn, target))
+event.listen(Spot, "after_delete", lambda mapper, conn, target: remove_spots(conn, [target.id]))
@@ -1,56 +1,96 @@
 """
 Main FastAPI application
+
+create_app() builds the application; the module-level `app` is the one served
+by uvicorn and Vercel. Schema migrations and the view counter flush run in the
+lifespan hook, not at import time.
 """
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import ORJSONResponse, PlainTextResponse
+import asyncio
 import os
 
-from app.database import engine, Base
-from app.routers import articles, spots, admin, auth
-
-# Create database tables
-Base.metadata.create_all(bind=engine)
-
-app = FastAPI(
-    title="LUMIÈRE API",
-    description="API pour le blog de voyage et photographie",
-    version="1.0.0"
-)
-
-# CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:3000", "http://127.0.0.1:3000"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Include routers
-app.include_router(articles.router, prefix="/api/articles", tags=["articles"])
-app.include_router(spots.router, prefix="/api/spots", tags=["spots"])
-app.include_router(admin.router, prefix="/api/admin", tags=["admin"])
-app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
-
-# Serve static files (HTML, CSS, JS)
-# Get project root (parent of backend directory)
-backend_dir = os.path.dirname(os.path.dirname(__file__))
-static_dir = os.path.dirname(backend_dir) if os.path.basename(backend_dir) == 'backend' else backend_dir
-static_files_dir = os.path.join(static_dir, "static")
-if os.path.exists(static_files_dir):
-    app.mount("/static", StaticFiles(directory=static_files_dir), name="static")
-
-@app.get("/")
-async def read_root():
-    """Serve the main HTML page"""
-    html_path = os.path.join(static_dir, "generated-page.html")
-    if os.path.exists(html_path):
-        return FileResponse(html_path, media_type="text/html")
-    return {"message": "LUMIÈRE API is running", "html_path": html_path}
-
-@app.get("/api/health")
-async def health_check():
-    """Health check endpoint"""
-    return {"status": "ok", "message": "API is running"}
+from app.database import pool_stats
+from app.views import view_counter
+from app.assets import STATIC_DIR, PrecompressedStaticFiles
+from app.compression import CompressionMiddleware
+from app.metrics import MetricsMiddleware, render_metrics, METRICS_TOKEN
+from app.conditional import cache_control, PRIVATE_CACHE_CONTROL
+
+# Set to false when migrations run at deploy time (python -m app.migrations),
+# to keep them off the cold start of each serverless instance
+RUN_MIGRATIONS = os.getenv("RUN_MIGRATIONS", "true").lower() in ("1", "true", "yes")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Bring the schema up to date, then flush pending article views periodically and on shutdown"""
+    if RUN_MIGRATIONS:
+        from app.migrations import run_migrations
+        run_migrations()
+    view_flusher = asyncio.create_task(view_counter.run())
+    try:
+        yield
+    finally:
+        view_flusher.cancel()
+        view_counter.flush()
+
+
+def create_app() -> FastAPI:
+    """Build the application (routes, middlewares, static files)"""
+    from app.routers import articles, spots, admin, auth, search, pages
+
+    app = FastAPI(
+        title="LUMIÈRE API",
+        description="API pour le blog de voyage et photographie",
+        version="1.0.0",
+        default_response_class=ORJSONResponse,
+        lifespan=lifespan
+    )
+
+    # Compress JSON and HTML responses (brotli or gzip)
+    app.add_middleware(CompressionMiddleware)
+
+    # CORS middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["http://localhost:3000", "http://127.0.0.1:3000"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "Server-Timing"],
+    )
+
+    # Outermost: times the whole request and measures the compressed size
+    app.add_middleware(MetricsMiddleware)
+
+    # Include routers
+    app.include_router(articles.router, prefix="/api/articles", tags=["articles"])
+    app.include_router(spots.router, prefix="/api/spots", tags=["spots"])
+    app.include_router(admin.router, prefix="/api/admin", tags=["admin"], dependencies=[Depends(cache_control(PRIVATE_CACHE_CONTROL))])
+    app.include_router(auth.router, prefix="/api/auth", tags=["auth"], dependencies=[Depends(cache_control(PRIVATE_CACHE_CONTROL))])
+    app.include_router(search.router, prefix="/api/search", tags=["search"], dependencies=[Depends(cache_control("public, max-age=60"))])
+    app.include_router(pages.router)
+
+    # Serve static files (CSS, JS), precompressed when built; pages are rendered by the pages router
+    if os.path.exists(STATIC_DIR):
+        app.mount("/static", PrecompressedStaticFiles(directory=STATIC_DIR), name="static")
+
+    @app.get("/api/health")
+    async def health_check():
+        """Health check endpoint (with database pool usage)"""
+        return {"status": "ok", "message": "API is running", "database": pool_stats()}
+
+    @app.get("/api/metrics", response_class=PlainTextResponse, include_in_schema=False)
+    async def metrics(request: Request):
+        """Request and database metrics in the Prometheus text format"""
+        if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+            raise HTTPException(status_code=401, detail="Invalid metrics token")
+        return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4", headers={"Cache-Control": "no-store"})
+
+    return app
+
+
+app = create_app()
@@ -0,0 +1,206 @@
+"""
+Request and database instrumentation
+
+MetricsMiddleware records, per route template, request counts, latency and
+response size histograms and the requests in flight. SQLAlchemy events on both
+engines time every statement; those issued while serving a request are added
+to its stats (a context variable), reported in its Server-Timing header. The
+statements slower than SLOW_QUERY_MS are logged with the route that issued
+them. Everything is exposed in the Prometheus text format by GET /api/metrics
+(bearer METRICS_TOKEN required when set).
+"""
+import os
+import time
+import bisect
+import logging
+import threading
+from contextvars import ContextVar
+from typing import Dict, Optional, Sequence, Tuple
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+slow_query_logger = logging.getLogger("app.slow_queries")
+
+Labels = Tuple[Tuple[str, str], ...]
+INF = 'le="+Inf"'
+
+
+def _labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in labels] + ([extra] if extra else [])
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name, self.help = name, help
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self, kind: str = "counter") -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {kind}"]
+        with self._lock:
+            lines += [f"{self.name}{_labels(k)} {v:g}" for k, v in sorted(self._values.items())]
+        return "\n".join(lines)
+
+
+class Gauge(Counter):
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def render(self, kind: str = "gauge") -> str:
+        return super().render(kind)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Sequence[float]):
+        self.name, self.help, self.buckets = name, help, tuple(buckets)
+        self._values: Dict[Labels, list] = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts = self._values.setdefault(key, [0] * (len(self.buckets) + 2))
+            i = bisect.bisect_left(self.buckets, value)
+            if i < len(self.buckets):
+                counts[i] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, counts in sorted(self._values.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets, counts):
+                    cumulative += n
+                    le = f'le="{bound:g}"'
+                    lines.append(f"{self.name}_bucket{_labels(key, le)} {cumulative}")
+                lines.append(f"{self.name}_bucket{_labels(key, INF)} {counts[-1]}")
+                lines.append(f"{self.name}_sum{_labels(key)} {counts[-2]:g}")
+                lines.append(f"{self.name}_count{_labels(key)} {counts[-1]}")
+        return "\n".join(lines)
+
+
+requests_total = Counter("http_requests_total", "HTTP requests by route, method and status")
+requests_in_flight = Gauge("http_requests_in_flight", "HTTP requests being served")
+request_duration = Histogram("http_request_duration_seconds", "Time to the end of the response by route", LATENCY_BUCKETS)
+response_size = Histogram("http_response_size_bytes", "Response body size (after compression) by route", SIZE_BUCKETS)
+request_queries = Histogram("http_request_db_queries", "Database statements per request by route", QUERY_COUNT_BUCKETS)
+query_duration = Histogram("db_query_duration_seconds", "Database statement execution time by engine", LATENCY_BUCKETS)
+slow_queries_total = Counter("db_slow_queries_total", "Statements slower than SLOW_QUERY_MS, by route")
+
+METRICS = (requests_total, requests_in_flight, request_duration, response_size, request_queries, query_duration, slow_queries_total)
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    return "\n".join(m.render() for m in METRICS) + "\n"
+
+
+class RequestStats:
+    """Database usage of the request being served"""
+
+    def __init__(self, scope: Scope):
+        self.scope = scope
+        self.queries = 0
+        self.db_time = 0.0
+
+    @property
+    def route(self) -> str:
+        return route_label(self.scope)
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+def route_label(scope: Scope) -> str:
+    """Route template (not the raw path, to bound the number of series)"""
+    route = scope.get("route")
+    if route is not None:
+        return getattr(route, "path", "unknown")
+    return scope.get("root_path") or "unmatched"  # mounts (static files) set root_path
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _record_query(conn, statement: str, engine: str) -> None:
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    query_duration.observe(elapsed, engine=engine)
+    stats = current_request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += elapsed
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        route = stats.route if stats is not None else "background"
+        slow_queries_total.inc(route=route)
+        slow_query_logger.warning("Slow query (%.1f ms) on %s: %s", elapsed * 1000, route, " ".join(statement.split()))
+
+
+def _handle_error(exception_context):
+    starts = exception_context.connection.info.get("query_start") if exception_context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+def instrument_engine(bind: Engine, name: str) -> None:
+    """Time the statements of an engine (sync engine of an async one)"""
+    event.listen(bind, "before_cursor_execute", _before_execute)
+    event.listen(bind, "after_cursor_execute", lambda conn, cursor, statement, *args: _record_query(conn, statement, name))
+    event.listen(bind, "handle_error", _handle_error)
+
+
+class MetricsMiddleware:
+    """Record latency, size and database usage of each HTTP request, and report
+    the latter in a Server-Timing header"""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        stats = RequestStats(scope)
+        token = current_request.set(stats)
+        status, size = 500, 0
+
+        async def send_with_metrics(message: Message) -> None:
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", f'app;dur={(time.perf_counter() - start) * 1000:.1f}, '
+                                                f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries"')
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            requests_in_flight.dec()
+            current_request.reset(token)
+            route, method = route_label(scope), scope["method"]
+            requests_total.inc(route=route, method=method, status=str(status))
+            request_duration.observe(time.perf_counter() - start, route=route, method=method)
+            response_size.observe(size, route=route)
+            request_queries.observe(stats.queries, route=route)
@@ -0,0 +1,140 @@
+"""
+Schema migrations
+
+Tables are created from the models; changes to existing databases (new indexes,
+new columns...) are applied by the numbered migrations below, recorded in the
+schema_version table. Migrations must be idempotent since a fresh database
+already gets the current schema from create_all. They spell out the indexes
+they create rather than reading them from the models, which may already have
+indexes on columns added by a later migration.
+
+Run with: python -m app.migrations
+"""
+from typing import Callable, List
+from sqlalchemy import Column, inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+from app.database import engine, Base
+from app import models, search, geo, clusters, stats
+
+MIGRATIONS: List[Callable[[Connection], None]] = []
+
+
+def migration(fn: Callable[[Connection], None]) -> Callable[[Connection], None]:
+    """Register a migration, version is its position in the list"""
+    MIGRATIONS.append(fn)
+    return fn
+
+
+def create_index(conn: Connection, name: str, table: str, columns: str) -> None:
+    """Create an index if it does not exist yet"""
+    conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+
+
+def recreate_index(conn: Connection, name: str, table: str, columns: str) -> None:
+    """Replace an index by one on other columns"""
+    conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    create_index(conn, name, table, columns)
+
+
+def add_column(conn: Connection, table: str, column: Column) -> None:
+    """Add a column to an existing table if it is missing"""
+    if column.name in {c["name"] for c in inspect(conn).get_columns(table)}:
+        return
+    column_type = column.type.compile(dialect=conn.dialect)
+    default = f" DEFAULT {column.server_default.arg}" if column.server_default is not None else ""
+    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column.name} {column_type}{default}"))
+
+
+@migration
+def composite_indexes(conn: Connection) -> None:
+    """Indexes for the filter/sort patterns of the list endpoints"""
+    create_index(conn, "ix_articles_status_published_at", "articles", "status, published_at DESC, id DESC")
+    create_index(conn, "ix_articles_category_status_published_at", "articles", "category, status, published_at DESC")
+    create_index(conn, "ix_articles_created_at", "articles", "created_at DESC, id DESC")
+    create_index(conn, "ix_articles_author_id", "articles", "author_id")
+    create_index(conn, "ix_spots_category_rating", "spots", "category, rating DESC, id DESC")
+    create_index(conn, "ix_spots_rating", "spots", "rating DESC, id DESC")
+    create_index(conn, "ix_spots_created_at", "spots", "created_at")
+    create_index(conn, "ix_comments_is_approved_created_at", "comments", "is_approved, created_at DESC")
+    create_index(conn, "ix_newsletter_is_active_subscribed_at", "newsletter", "is_active, subscribed_at")
+    create_index(conn, "ix_users_created_at", "users", "created_at DESC, id DESC")
+
+
+@migration
+def full_text_search(conn: Connection) -> None:
+    """Search index for articles and spots"""
+    search.create_index(conn)
+    search.rebuild_index(conn)
+
+
+@migration
+def spatial_index(conn: Connection) -> None:
+    """Bounding-box index for spots"""
+    create_index(conn, "ix_spots_latitude_longitude", "spots", "latitude, longitude")
+    geo.create_index(conn)
+
+
+@migration
+def spot_clusters(conn: Connection) -> None:
+    """Precomputed map clusters (table created by create_all)"""
+    clusters.rebuild(conn)
+
+
+@migration
+def user_token_version(conn: Connection) -> None:
+    """Version of the claims carried by user tokens"""
+    add_column(conn, "users", models.User.__table__.c.token_version)
+
+
+@migration
+def daily_stats(conn: Connection) -> None:
+    """Per-day rollups of the dashboard metrics (table created by create_all)"""
+    stats.rebuild_daily(conn)
+
+
+@migration
+def comment_threads(conn: Connection) -> None:
+    """Replies to comments and the index of the per-article comment lists"""
+    add_column(conn, "comments", models.Comment.__table__.c.parent_id)
+    create_index(conn, "ix_comments_article_id_is_approved_created_at", "comments", "article_id, is_approved, created_at DESC")
+    create_index(conn, "ix_comments_parent_id", "comments", "parent_id")
+
+
+@migration
+def row_versions(conn: Connection) -> None:
+    """Edit counters of articles and spots (ETags and rendered pages)"""
+    add_column(conn, "articles", models.Article.__table__.c.version)
+    add_column(conn, "spots", models.Spot.__table__.c.version)
+
+
+@migration
+def list_query_indexes(conn: Connection) -> None:
+    """Indexes matching the statements of the list endpoints: id ends the category index as it
+    ends the keyset order, approved replies are looked up by parent_id and is_approved"""
+    recreate_index(conn, "ix_articles_category_status_published_at", "articles", "category, status, published_at DESC, id DESC")
+    recreate_index(conn, "ix_comments_parent_id", "comments", "parent_id, is_approved")
+
+
+@migration
+def comment_index_tie_breaks(conn: Connection) -> None:
+    """id at the end of the comment list indexes, as at the end of their keyset order"""
+    recreate_index(conn, "ix_comments_is_approved_created_at", "comments", "is_approved, created_at DESC, id DESC")
+    recreate_index(conn, "ix_comments_article_id_is_approved_created_at", "comments",
+                   "article_id, is_approved, created_at DESC, id DESC")
+
+
+def run_migrations(bind: Engine = engine) -> int:
+    """Create missing tables and apply pending migrations, return the schema version"""
+    Base.metadata.create_all(bind=bind)
+    with bind.begin() as conn:
+        conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"))
+        current = conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+        for version, fn in enumerate(MIGRATIONS[current:], start=current + 1):
+            fn(conn)
+            conn.execute(text("INSERT INTO schema_version (version) VALUES (:v)"), {"v": version})
+    return len(MIGRATIONS)
+
+
+if __name__ == "__main__":
+    print(f"Schema at version {run_migrations()}")
@@ -1,9 +1,9 @@
 """
 SQLAlchemy models for the database
 """
-from sqlalchemy import Column, Integer, String, Float, Text, DateTime, Boolean, ForeignKey, Enum
-from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy import Column, Integer, String, Float, Text, Date, DateTime, Boolean, ForeignKey, Enum, Index
+from sqlalchemy.orm import relationship, query_expression
+from sqlalchemy.sql import func, literal_column
 import enum
 from app.database import Base
 
@@ -31,12 +31,22 @@ class User(Base):
     hashed_password = Column(String, nullable=False)
     full_name = Column(String, nullable=True)
     is_admin = Column(Boolean, default=False)
+    # Bumped when the token claims change, invalidating tokens issued before
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Filled by queries that ask for it (see routers/admin.py)
+    articles_count = query_expression()
     
     articles = relationship("Article", back_populates="author")
     comments = relationship("Comment", back_populates="author")
 
 
+def _author_name(obj):
+    """Display name of the author if loaded (never lazy-loads it)"""
+    author = obj.__dict__.get("author")
+    return (author.full_name or author.username) if author else None
+
+
 class Article(Base):
     __tablename__ = "articles"
 
@@ -53,11 +63,14 @@ class Article(Base):
     published_at = Column(DateTime(timezone=True), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    version = Column(Integer, nullable=False, default=1, server_default="1", onupdate=literal_column("version") + 1)
     views = Column(Integer, default=0)
     
     author = relationship("User", back_populates="articles")
     comments = relationship("Comment", back_populates="article")
 
+    author_name = property(_author_name)
+
 
 class Spot(Base):
     __tablename__ = "spots"
@@ -76,6 +89,28 @@ class Spot(Base):
     equipment_needed = Column(String, nullable=True)  # e.g., "Trépied", "Objectif grand angle"
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    version = Column(Integer, nullable=False, default=1, server_default="1", onupdate=literal_column("version") + 1)
+
+
+class SpotCluster(Base):
+    """Spot count and coordinate sums per grid cell and zoom level (see app/clusters.py)"""
+    __tablename__ = "spot_clusters"
+
+    zoom = Column(Integer, primary_key=True)
+    cell_x = Column(Integer, primary_key=True)
+    cell_y = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    lat_sum = Column(Float, nullable=False, default=0.0)
+    lon_sum = Column(Float, nullable=False, default=0.0)
+
+
+class DailyStat(Base):
+    """Per-day total of a dashboard metric: views, subscribers, spots, comments (see app/stats.py)"""
+    __tablename__ = "daily_stats"
+
+    metric = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
 
 
 class Comment(Base):
@@ -85,6 +120,8 @@ class Comment(Base):
     content = Column(Text, nullable=False)
     article_id = Column(Integer, ForeignKey("articles.id"), nullable=False)
     author_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    # Thread root this comment replies to (threads are one level deep)
+    parent_id = Column(Integer, ForeignKey("comments.id"), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     is_approved = Column(Boolean, default=False)
@@ -92,6 +129,8 @@ class Comment(Base):
     article = relationship("Article", back_populates="comments")
     author = relationship("User", back_populates="comments")
 
+    author_name = property(_author_name)
+
 
 class Newsletter(Base):
     __tablename__ = "newsletter"
@@ -100,3 +139,19 @@ class Newsletter(Base):
     email = Column(String, unique=True, index=True, nullable=False)
     subscribed_at = Column(DateTime(timezone=True), server_default=func.now())
     is_active = Column(Boolean, default=True)
+
+
+# Composite indexes matching the list queries (filter columns first, then sort keys)
+Index("ix_articles_status_published_at", Article.status, Article.published_at.desc(), Article.id.desc())
+Index("ix_articles_category_status_published_at", Article.category, Article.status, Article.published_at.desc(), Article.id.desc())
+Index("ix_articles_created_at", Article.created_at.desc(), Article.id.desc())
+Index("ix_articles_author_id", Article.author_id)
+Index("ix_spots_category_rating", Spot.category, Spot.rating.desc(), Spot.id.desc())
+Index("ix_spots_rating", Spot.rating.desc(), Spot.id.desc())
+Index("ix_spots_created_at", Spot.created_at)
+Index("ix_spots_latitude_longitude", Spot.latitude, Spot.longitude)
+Index("ix_comments_is_approved_created_at", Comment.is_approved, Comment.created_at.desc(), Comment.id.desc())
+Index("ix_comments_article_id_is_approved_created_at", Comment.article_id, Comment.is_approved, Comment.created_at.desc(), Comment.id.desc())
+Index("ix_comments_parent_id", Comment.parent_id, Comment.is_approved)
+Index("ix_newsletter_is_active_subscribed_at", Newsletter.is_active, Newsletter.subscribed_at)
+Index("ix_users_created_at", User.created_at.desc(), User.id.desc())
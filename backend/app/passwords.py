@@ -0,0 +1,64 @@
+"""
+Password hashing off the event loop
+
+bcrypt costs 100-300 ms of CPU per call; running it in the request coroutine
+stalls every other request of the worker. Calls go to a small thread pool
+(bcrypt releases the GIL) and are refused with a 503 once too many are waiting.
+"""
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Optional, Tuple
+from fastapi import HTTPException
+
+# Cost factor of new hashes; hashes made with another cost are upgraded at login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", "2"))
+# Calls allowed to wait for a worker before answering 503
+PASSWORD_QUEUE_LIMIT = int(os.getenv("PASSWORD_QUEUE_LIMIT", "16"))
+
+
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    """passlib context, built on first use (passlib and bcrypt are slow to import)"""
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+
+class PasswordPool:
+    """Bounded thread pool running the password hashing calls"""
+
+    def __init__(self, workers: int = PASSWORD_WORKERS, queue_limit: int = PASSWORD_QUEUE_LIMIT):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password")
+        self._in_flight = 0
+
+    @property
+    def in_flight(self) -> int:
+        """Calls running or waiting for a worker"""
+        return self._in_flight
+
+    async def run(self, func, *args):
+        """Run func(*args) on the pool, 503 if the queue is full"""
+        if self._in_flight >= self.workers + self.queue_limit:
+            raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": "1"})
+        self._in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self._in_flight -= 1
+
+
+password_pool = PasswordPool()
+
+
+async def hash_password(password: str) -> str:
+    """Hash a password on the pool"""
+    return await password_pool.run(get_pwd_context().hash, password)
+
+
+async def verify_and_update(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Check a password on the pool; also return a new hash if the stored one is outdated"""
+    return await password_pool.run(get_pwd_context().verify_and_update, password, hashed_password)
@@ -0,0 +1,262 @@
+"""
+Server-side rendered public pages
+
+The homepage and /articles/{slug} are served as final HTML: the page shell
+(generated-page.html) with the article cards, or the article, filled in, so
+neither the first paint nor crawlers wait for an API call.
+
+Rendered pages are kept on disk in RENDER_CACHE_DIR, named after a digest of
+the shell and of the version of the articles they show (a counter bumped by
+every update, not a timestamp, which has a one-second resolution on SQLite): an
+edit changes the name, so a stale page is never served, and update_article
+renders the new version right away. `python -m app.render DIR` exports the public site to DIR
+for static hosting.
+"""
+import os
+import re
+import sys
+import glob
+import html
+import asyncio
+import hashlib
+import shutil
+import tempfile
+from datetime import datetime
+from typing import List, Optional
+from sqlalchemy import desc, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+
+from app.models import Article, ArticleStatus, User
+from app.assets import PROJECT_DIR, STATIC_DIR, load_manifest, rewrite_urls
+
+SHELL_PATH = os.path.join(PROJECT_DIR, "generated-page.html")
+
+# The temporary directory is the only writable one on some hosts (Vercel)
+RENDER_CACHE_DIR = os.getenv("RENDER_CACHE_DIR", os.path.join(tempfile.gettempdir(), "lumiere-pages"))
+HOME_ARTICLES = 10  # same as the list loaded by static/js/app.js
+
+DEFAULT_COVER = "https://images.unsplash.com/photo-1493976040374-85c8e12f0c0e?ixlib=rb-4.0.3&auto=format&fit=crop&w=800&q=80"
+MONTHS = ("janv.", "févr.", "mars", "avr.", "mai", "juin", "juil.", "août", "sept.", "oct.", "nov.", "déc.")
+
+GRID = re.compile(r'(<div class="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-8")>.*?(</div>\s*</section>)', re.S)
+TITLE = re.compile(r"<title>.*?</title>", re.S)
+HOME_VIEW = '<div id="view-home" class="block animate-fade-in">'
+
+_shell = {"key": None, "html": "", "version": ""}
+
+
+def load_shell() -> Optional[tuple]:
+    """(html, version) of the page shell pointing to the built assets, reread when
+    the file or the asset build changes; None if missing"""
+    try:
+        mtime = os.stat(SHELL_PATH).st_mtime
+    except OSError:
+        return None
+    manifest = load_manifest()
+    key = (mtime, tuple(manifest.items()))
+    if key != _shell["key"]:
+        with open(SHELL_PATH, encoding="utf-8") as f:
+            text = rewrite_urls(f.read(), manifest)
+        _shell.update(key=key, html=text, version=hashlib.sha1(text.encode()).hexdigest()[:8])
+    return _shell["html"], _shell["version"]
+
+
+def _e(value) -> str:
+    return html.escape(str(value or ""))
+
+
+def _date(article: Article) -> str:
+    d = article.published_at or article.created_at or datetime.now()
+    return f"{d.day} {MONTHS[d.month - 1]} {d.year}"
+
+
+def _author(user: User) -> str:
+    return (user.full_name or user.username) if user else "Auteur"
+
+
+def _card(article: Article) -> str:
+    return f"""
+                    <article class="group cursor-pointer">
+                        <a href="/articles/{_e(article.slug)}">
+                        <div class="aspect-[4/3] w-full overflow-hidden rounded-xl bg-zinc-200 relative mb-4">
+                            <img src="{_e(article.cover_image or DEFAULT_COVER)}" alt="{_e(article.title)}" class="object-cover w-full h-full group-hover:scale-105 transition-transform duration-500">
+                            <div class="absolute top-4 left-4 bg-white/90 backdrop-blur px-2 py-1 rounded-md text-[10px] uppercase tracking-wider font-semibold text-zinc-800">{_e(article.category or "Article")}</div>
+                        </div>
+                        <div class="flex items-center space-x-2 text-xs text-zinc-500 mb-2">
+                            <span>{_date(article)}</span>
+                            <span class="w-1 h-1 bg-zinc-300 rounded-full"></span>
+                            <span>{article.reading_time or 5} min de lecture</span>
+                        </div>
+                        <h3 class="text-lg font-semibold text-zinc-900 mb-2 leading-snug group-hover:text-zinc-600 transition-colors">{_e(article.title)}</h3>
+                        <p class="text-sm text-zinc-500 line-clamp-2">{_e(article.excerpt)}</p>
+                        </a>
+                    </article>"""
+
+
+def render_home(shell: str, articles: List[Article]) -> str:
+    """Shell with the cards of the latest articles (the sample cards are kept when there are none)"""
+    if not articles:
+        return shell
+    cards = "".join(_card(a) for a in articles)
+    return GRID.sub(lambda m: f"{m.group(1)} data-rendered>{cards}\n                {m.group(2)}", shell, count=1)
+
+
+def render_article(shell: str, article: Article) -> str:
+    """Shell showing an article instead of the home view"""
+    paragraphs = "".join(f"<p>{_e(p).replace(chr(10), '<br>')}</p>"
+                         for p in re.split(r"\n\s*\n", article.content or "") if p.strip())
+    view = f"""<div id="view-article" class="block animate-fade-in">
+            <article class="max-w-3xl mx-auto px-4 sm:px-6 lg:px-8 py-16">
+                <a href="/" class="text-sm text-zinc-500 hover:text-zinc-900 flex items-center mb-8">
+                    <span class="iconify mr-1" data-icon="lucide:arrow-left" data-width="14"></span> Retour au journal
+                </a>
+                <div class="flex items-center space-x-2 text-xs text-zinc-500 mb-4">
+                    <span class="uppercase tracking-wider font-semibold text-zinc-800">{_e(article.category or "Article")}</span>
+                    <span class="w-1 h-1 bg-zinc-300 rounded-full"></span>
+                    <span>{_date(article)}</span>
+                    <span class="w-1 h-1 bg-zinc-300 rounded-full"></span>
+                    <span>{article.reading_time or 5} min de lecture</span>
+                </div>
+                <h1 class="text-3xl md:text-5xl font-semibold tracking-tight text-zinc-900 mb-6">{_e(article.title)}</h1>
+                <p class="text-lg text-zinc-500 font-light mb-4">{_e(article.excerpt)}</p>
+                <p class="text-sm text-zinc-500 mb-10">Par {_e(_author(article.author))}</p>
+                <img src="{_e(article.cover_image or DEFAULT_COVER)}" alt="{_e(article.title)}" class="w-full rounded-xl mb-10">
+                <div class="text-zinc-700 leading-relaxed space-y-4">{paragraphs}</div>
+            </article>
+        </div>
+
+        """
+    head = (f"<title>{_e(article.title)} | LUMIÈRE</title>\n"
+            f'<meta name="description" content="{_e(article.excerpt)}">\n'
+            f'<meta property="og:title" content="{_e(article.title)}">\n'
+            f'<meta property="og:description" content="{_e(article.excerpt)}">\n'
+            f'<meta property="og:image" content="{_e(article.cover_image or DEFAULT_COVER)}">')
+    page = TITLE.sub(lambda m: head, shell, count=1)
+    return page.replace(HOME_VIEW, view + HOME_VIEW.replace('"block ', '"hidden '), 1)
+
+
+def _digest(*parts) -> str:
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:16]
+
+
+class PageCache:
+    """Rendered pages on disk; a page name carries the digest of what it was built from,
+    the older versions of a page are removed when a new one is written"""
+
+    def __init__(self, directory: str = RENDER_CACHE_DIR):
+        self.directory = directory
+
+    def path(self, name: str, digest: str) -> str:
+        return os.path.join(self.directory, f"{name}-{digest}.html")
+
+    def get(self, name: str, digest: str) -> Optional[str]:
+        path = self.path(name, digest)
+        return path if os.path.exists(path) else None
+
+    def set(self, name: str, digest: str, page: str) -> None:
+        """Store a page, ignoring write errors (the page is then rendered on each request)"""
+        path = self.path(name, digest)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(page)
+            os.replace(tmp, path)
+            self.remove(name, keep=path)
+        except OSError:
+            pass
+
+    def remove(self, name: str, keep: Optional[str] = None) -> None:
+        """Remove every version of a page but keep"""
+        for old in glob.glob(os.path.join(glob.escape(self.directory), f"{name}-*.html")):
+            if old != keep:
+                try:
+                    os.remove(old)
+                except OSError:
+                    pass
+
+    def clear(self) -> None:
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+page_cache = PageCache()
+
+published = Article.status == ArticleStatus.PUBLISHED
+
+
+async def home_page(db: AsyncSession, force: bool = False) -> Optional[tuple]:
+    """(path of the cached file or None, html) of the homepage, rendered again if force; None without shell"""
+    shell = load_shell()
+    if shell is None:
+        return None
+    latest = select(Article.id, Article.version).where(published).order_by(desc(Article.published_at)).limit(HOME_ARTICLES)
+    digest = _digest(shell[1], (await db.execute(latest)).all())
+    cached = None if force else page_cache.get("home", digest)
+    if cached:
+        return cached, None
+    articles = list(await db.scalars(select(Article).where(published).order_by(desc(Article.published_at)).limit(HOME_ARTICLES)))
+    page = render_home(shell[0], articles)
+    page_cache.set("home", digest, page)
+    return None, page
+
+
+async def article_page(db: AsyncSession, slug: str, force: bool = False) -> Optional[tuple]:
+    """(article id, path of the cached file or None, html) of a published article, rendered again
+    if force; None if not found"""
+    shell = load_shell()
+    row = (await db.execute(
+        select(Article.id, Article.version, User.username, User.full_name).join(Article.author).where(Article.slug == slug, published)
+    )).first()
+    if shell is None or row is None:
+        return None
+    name, digest = f"article-{row.id}", _digest(shell[1], tuple(row))
+    cached = None if force else page_cache.get(name, digest)
+    if cached:
+        return row.id, cached, None
+    article = await db.get(Article, row.id, options=[joinedload(Article.author)])
+    page = render_article(shell[0], article)
+    page_cache.set(name, digest, page)
+    return row.id, None, page
+
+
+async def regenerate(db: AsyncSession, article: Article) -> None:
+    """Render again the pages showing an article after it changed"""
+    if article.status == ArticleStatus.PUBLISHED:
+        await article_page(db, article.slug, force=True)
+    else:
+        page_cache.remove(f"article-{article.id}")
+    await home_page(db, force=True)
+
+
+def _write(path: str, page: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(page)
+
+
+async def export_site(db: AsyncSession, out_dir: str) -> int:
+    """Write the homepage, every published article and static/ to out_dir, return the number of pages"""
+    shell = load_shell()
+    if shell is None:
+        raise FileNotFoundError(SHELL_PATH)
+    articles = list(await db.scalars(
+        select(Article).options(joinedload(Article.author)).where(published).order_by(desc(Article.published_at))
+    ))
+    _write(os.path.join(out_dir, "index.html"), render_home(shell[0], articles[:HOME_ARTICLES]))
+    for article in articles:
+        _write(os.path.join(out_dir, "articles", article.slug, "index.html"), render_article(shell[0], article))
+    if os.path.isdir(STATIC_DIR):
+        shutil.copytree(STATIC_DIR, os.path.join(out_dir, "static"), dirs_exist_ok=True)
+    return len(articles) + 1
+
+
+async def _export(out_dir: str) -> int:
+    from app.database import AsyncSessionLocal
+    async with AsyncSessionLocal() as db:
+        return await export_site(db, out_dir)
+
+
+if __name__ == "__main__":
+    out = sys.argv[1] if len(sys.argv) > 1 else "dist"
+    print(f"{asyncio.run(_export(out))} pages written to {out}")
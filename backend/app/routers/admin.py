@@ -1,56 +1,83 @@
 """
 Admin API routes
 """
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from datetime import datetime, timedelta
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, load_only, with_expression
+from sqlalchemy import func, select, update, delete
+from datetime import date, datetime, timedelta
+from typing import List, Literal, Optional, Union
+import os
 
 from app.database import get_db
-from app.models import Article, Spot, User, Newsletter, Comment, ArticleStatus
-from app.schemas import UserResponse, UserUpdate
+from app.models import Article, Spot, User, Comment, ArticleStatus
+from app.schemas import UserResponse, UserUpdate, BulkSelection, CommentSelection, ArticleSelection, SpotSelection, UserSelection
 from app.auth import get_current_admin_user
+from app.views import view_counter
+from app.utils import get_or_404, update_model, delete_model, keyset_page
+from app.search import search_filter, remove_items
+from app.cache import response_cache
+from app.stats import stats_snapshot, get_timeseries
+from app.user_cache import user_cache
+from app.render import page_cache
+from app import geo, clusters
 
 router = APIRouter()
 
+# IDs per statement in bulk operations (SQLite limits the number of bound parameters)
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "500"))
+
 
 def _calc_trend(current, previous):
     return round(((current - previous) / previous * 100) if previous > 0 else 0, 1)
 
 
 @router.get("/stats")
-async def get_stats(db: Session = Depends(get_db), current_user = Depends(get_current_admin_user)):
-    """Get dashboard statistics"""
-    now = datetime.utcnow()
-    last_month = now - timedelta(days=30)
-    
-    total_views = db.query(func.sum(Article.views)).scalar() or 0
-    views_last_month = db.query(func.sum(Article.views)).filter(Article.created_at >= last_month).scalar() or 0
-    views_previous = total_views - views_last_month
-    
-    total_spots = db.query(Spot).count()
-    spots_last_month = db.query(Spot).filter(Spot.created_at >= last_month).count()
-    spots_previous = total_spots - spots_last_month
-    
-    total_subscribers = db.query(Newsletter).filter(Newsletter.is_active == True).count()
-    subs_last_month = db.query(Newsletter).filter(Newsletter.subscribed_at >= last_month, Newsletter.is_active == True).count()
-    subs_previous = total_subscribers - subs_last_month
+async def get_stats(db: AsyncSession = Depends(get_db), current_user = Depends(get_current_admin_user)):
+    """Get dashboard statistics (`computed_at` tells how fresh the counters are)"""
+    stats, computed_at = await stats_snapshot.get(db)
+    # Views still pending in the view counter were made just now
+    pending_views = view_counter.pending_total()
+    total_views = stats["total_views"] + pending_views
+    views_previous = total_views - (stats["views_last_month"] + pending_views)
+    spots_previous = stats["total_spots"] - stats["spots_last_month"]
+    subs_previous = stats["total_subscribers"] - stats["subs_last_month"]
     
     return {
         "total_views": int(total_views),
-        "total_spots": total_spots,
-        "total_subscribers": total_subscribers,
-        "pending_comments": db.query(Comment).filter(Comment.is_approved == False).count(),
+        "total_spots": stats["total_spots"],
+        "total_subscribers": stats["total_subscribers"],
+        "pending_comments": stats["pending_comments"],
         "trend_views": _calc_trend(total_views, views_previous),
-        "trend_spots": _calc_trend(total_spots, spots_previous),
-        "trend_subscribers": _calc_trend(total_subscribers, subs_previous)
+        "trend_spots": _calc_trend(stats["total_spots"], spots_previous),
+        "trend_subscribers": _calc_trend(stats["total_subscribers"], subs_previous),
+        "computed_at": computed_at.isoformat() + "Z"
     }
 
 
+@router.get("/stats/timeseries")
+async def get_stats_timeseries(
+    metric: Literal["views", "subscribers", "spots", "comments"],
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(get_current_admin_user)
+):
+    """Daily values of a metric between `from` and `to` (default: the last 30 days)"""
+    today = datetime.utcnow().date()
+    date_to = date_to or today
+    date_from = date_from or date_to - timedelta(days=29)
+    if date_from > date_to or (date_to - date_from).days > 366:
+        raise HTTPException(status_code=400, detail="from must precede to, at most 367 days apart")
+    points = await get_timeseries(db, metric, date_from, date_to)
+    if metric == "views" and date_from <= today <= date_to:
+        points[(today - date_from).days]["value"] += view_counter.pending_total()
+    return {"metric": metric, "from": date_from.isoformat(), "to": date_to.isoformat(), "points": points}
+
+
 @router.get("/articles", response_model=dict)
 async def get_all_articles(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_admin_user),
     skip: int = Query(0, ge=0),
     limit: int = Query(20, ge=1, le=100),
@@ -58,18 +85,29 @@ async def get_all_articles(
     category: Optional[str] = None,
     date_from: Optional[str] = None,
     date_to: Optional[str] = None,
-    search: Optional[str] = None
+    search: Optional[str] = None,
+    cursor: Optional[str] = None,
+    with_total: bool = True
 ):
-    """Get all articles for admin dashboard with filters and pagination"""
-    query = db.query(Article)
-    if status: query = query.filter(Article.status == status)
-    if category: query = query.filter(Article.category == category)
-    if date_from: query = query.filter(Article.created_at >= datetime.fromisoformat(date_from.replace('Z', '+00:00')))
-    if date_to: query = query.filter(Article.created_at <= datetime.fromisoformat(date_to.replace('Z', '+00:00')))
-    if search: query = query.filter((Article.title.ilike(f'%{search}%')) | (Article.content.ilike(f'%{search}%')))
+    """Get all articles for admin dashboard with filters and pagination (offset or keyset via `cursor`)"""
+    query = select(Article)
+    if status: query = query.where(Article.status == status)
+    if category: query = query.where(Article.category == category)
+    if date_from: query = query.where(Article.created_at >= datetime.fromisoformat(date_from.replace('Z', '+00:00')))
+    if date_to: query = query.where(Article.created_at <= datetime.fromisoformat(date_to.replace('Z', '+00:00')))
+    if search: query = query.where(search_filter(db, "article", search, Article.title, Article.content))
     
-    total = query.count()
-    articles = query.order_by(Article.created_at.desc()).offset(skip).limit(limit).all()
+    total = await db.scalar(select(func.count()).select_from(query.subquery())) if with_total else None
+    # Only the columns shown in the table, author name loaded in the same query
+    query = query.options(
+        load_only(Article.id, Article.title, Article.cover_image, Article.status, Article.created_at, Article.views),
+        joinedload(Article.author).load_only(User.username, User.full_name)
+    )
+    next_cursor = None
+    if cursor is not None:
+        articles, next_cursor = await keyset_page(db, query, Article.created_at, Article.id, cursor, limit)
+    else:
+        articles = await db.scalars(query.order_by(Article.created_at.desc()).offset(skip).limit(limit))
     
     return {
         "items": [{
@@ -78,20 +116,28 @@ async def get_all_articles(
             "author_initials": (a.author.full_name or a.author.username)[:2].upper() if a.author else "??",
             "status": a.status.value, "created_at": a.created_at.isoformat() if a.created_at else None, "views": a.views
         } for a in articles],
-        "total": total, "skip": skip, "limit": limit
+        "total": total, "skip": skip, "limit": limit, "next_cursor": next_cursor
     }
 
 
 @router.get("/comments")
 async def get_comments(
-    db: Session = Depends(get_db),
-    current_user = Depends(get_current_admin_user)
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(get_current_admin_user),
+    is_approved: Optional[bool] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200)
 ):
-    """Get all comments for moderation"""
-    comments = db.query(Comment).order_by(Comment.created_at.desc()).all()
-    result = []
-    for comment in comments:
-        result.append({
+    """Moderation queue, newest first, paginated by keyset (pass `next_cursor` back as `cursor`)"""
+    query = select(Comment).options(
+        joinedload(Comment.article).load_only(Article.title),
+        joinedload(Comment.author).load_only(User.username, User.full_name)
+    )
+    if is_approved is not None:
+        query = query.where(Comment.is_approved == is_approved)
+    comments, next_cursor = await keyset_page(db, query, Comment.created_at, Comment.id, cursor or "", limit)
+    return {
+        "items": [{
             "id": comment.id,
             "content": comment.content,
             "article_id": comment.article_id,
@@ -99,90 +145,217 @@ async def get_comments(
             "author": comment.author.full_name or comment.author.username if comment.author else "Unknown",
             "is_approved": comment.is_approved,
             "created_at": comment.created_at.isoformat() if comment.created_at else None
-        })
-    return result
+        } for comment in comments],
+        "next_cursor": next_cursor
+    }
+
+
+@router.get("/comments/pending-count")
+async def get_pending_comments_count(db: AsyncSession = Depends(get_db), current_user = Depends(get_current_admin_user)):
+    """Number of comments awaiting approval (for the badge)"""
+    return {"pending": await db.scalar(select(func.count(Comment.id)).where(Comment.is_approved == False))}
+
+
+def _chunks(ids: List[int]):
+    for start in range(0, len(ids), BULK_CHUNK_SIZE):
+        yield ids[start:start + BULK_CHUNK_SIZE]
+
+
+async def _select_ids(db: AsyncSession, model, selection: Union[List[int], BulkSelection]) -> List[int]:
+    """Existing IDs picked by a bulk selection; filters are `created_before` and equality on the other fields"""
+    if isinstance(selection, list):
+        selection = BulkSelection(ids=selection)
+    conditions = [
+        model.created_at < value if name == "created_before" else getattr(model, name) == value
+        for name, value in selection.model_dump(exclude_none=True, exclude={"ids"}).items()
+    ]
+    if selection.ids is None:
+        if not conditions:
+            raise HTTPException(status_code=400, detail="Empty selection: pass ids or at least one filter")
+        return (await db.scalars(select(model.id).where(*conditions).order_by(model.id))).all()
+    ids = []
+    for chunk in _chunks(sorted(set(selection.ids))):
+        ids += (await db.scalars(select(model.id).where(model.id.in_(chunk), *conditions).order_by(model.id))).all()
+    return ids
+
+
+async def _comment_article_ids(db: AsyncSession, comment_ids: List[int]) -> set:
+    """Articles of some comments, whose cached comment lists a bulk statement must drop"""
+    article_ids = set()
+    for chunk in _chunks(comment_ids):
+        article_ids.update((await db.scalars(select(Comment.article_id).where(Comment.id.in_(chunk)).distinct())).all())
+    return article_ids
 
 
 @router.post("/comments/{comment_id}/approve")
-async def approve_comment(comment_id: int, db: Session = Depends(get_db), current_user = Depends(get_current_admin_user)):
+async def approve_comment(comment_id: int, db: AsyncSession = Depends(get_db), current_user = Depends(get_current_admin_user)):
     """Approve a comment"""
-    from app.utils import get_or_404
-    comment = get_or_404(db, Comment, comment_id)
+    comment = await get_or_404(db, Comment, comment_id)
     comment.is_approved = True
-    db.commit()
+    await db.commit()
     return {"message": "Comment approved"}
 
 @router.post("/comments/bulk-approve")
-async def bulk_approve_comments(comment_ids: List[int], db: Session = Depends(get_db), current_user = Depends(get_current_admin_user)):
-    """Bulk approve comments"""
-    db.query(Comment).filter(Comment.id.in_(comment_ids)).update({"is_approved": True}, synchronize_session=False)
-    db.commit()
-    return {"message": f"{len(comment_ids)} comments approved"}
+async def bulk_approve_comments(selection: Union[List[int], CommentSelection], db: AsyncSession = Depends(get_db), current_user = Depends(get_current_admin_user)):
+    """Bulk approve comments (list of IDs, or IDs and/or filters)"""
+    comment_ids = await _select_ids(db, Comment, selection)
+    article_ids = await _comment_article_ids(db, comment_ids)
+    approved = 0
+    for chunk in _chunks(comment_ids):
+        approved += (await db.execute(
+            update(Comment).where(Comment.id.in_(chunk), Comment.is_approved == False).values(is_approved=True)
+        )).rowcount
+    await db.commit()
+    response_cache.invalidate(*(f"comments:article:{i}" for i in article_ids))
+    return {"message": f"{approved} comments approved", "approved_count": approved}
 
 @router.post("/comments/bulk-delete")
-async def bulk_delete_comments(comment_ids: List[int], db: Session = Depends(get_db), current_user = Depends(get_current_admin_user)):
-    """Bulk delete comments"""
-    deleted = db.query(Comment).filter(Comment.id.in_(comment_ids)).delete(synchronize_session=False)
-    db.commit()
+async def bulk_delete_comments(selection: Union[List[int], CommentSelection], db: AsyncSession = Depends(get_db), current_user = Depends(get_current_admin_user)):
+    """Bulk delete comments and their replies (list of IDs, or IDs and/or filters)"""
+    comment_ids = await _select_ids(db, Comment, selection)
+    article_ids = await _comment_article_ids(db, comment_ids)
+    deleted = 0
+    for chunk in _chunks(comment_ids):
+        # Replies go with the comment they answer (one list per statement: BULK_CHUNK_SIZE parameters at most)
+        deleted += (await db.execute(delete(Comment).where(Comment.parent_id.in_(chunk)))).rowcount
+        deleted += (await db.execute(delete(Comment).where(Comment.id.in_(chunk)))).rowcount
+    await db.commit()
+    response_cache.invalidate(*(f"comments:article:{i}" for i in article_ids))
     return {"message": f"{deleted} comments deleted", "deleted_count": deleted}
 
 @router.delete("/comments/{comment_id}")
-async def delete_comment(comment_id: int, db: Session = Depends(get_db), current_user = Depends(get_current_admin_user)):
+async def delete_comment(comment_id: int, db: AsyncSession = Depends(get_db), current_user = Depends(get_current_admin_user)):
     """Delete a comment"""
-    from app.utils import get_or_404, delete_model
-    return delete_model(db, get_or_404(db, Comment, comment_id))
+    comment = await get_or_404(db, Comment, comment_id)
+    await db.execute(delete(Comment).where(Comment.parent_id == comment_id))
+    return await delete_model(db, comment)
 
 @router.post("/articles/bulk-delete")
-async def bulk_delete_articles(article_ids: List[int], db: Session = Depends(get_db), current_user = Depends(get_current_admin_user)):
-    """Bulk delete articles"""
-    deleted = db.query(Article).filter(Article.id.in_(article_ids)).delete(synchronize_session=False)
-    db.commit()
-    return {"message": f"{deleted} articles deleted", "deleted_count": deleted}
+async def bulk_delete_articles(selection: Union[List[int], ArticleSelection], db: AsyncSession = Depends(get_db), current_user = Depends(get_current_admin_user)):
+    """Bulk delete articles with their comments (list of IDs, or IDs and/or filters)"""
+    article_ids = await _select_ids(db, Article, selection)
+    conn = await db.connection()
+    deleted = deleted_comments = 0
+    for chunk in _chunks(article_ids):
+        deleted_comments += (await db.execute(delete(Comment).where(Comment.article_id.in_(chunk)))).rowcount
+        deleted += (await db.execute(delete(Article).where(Article.id.in_(chunk)))).rowcount
+        await conn.run_sync(remove_items, "article", chunk)
+    await db.commit()
+    for article_id in article_ids:
+        view_counter.discard(article_id)
+        page_cache.remove(f"article-{article_id}")
+    response_cache.invalidate("articles", *(f"article:{i}" for i in article_ids), *(f"comments:article:{i}" for i in article_ids))
+    return {"message": f"{deleted} articles deleted", "deleted_count": deleted, "deleted_comments": deleted_comments}
 
-@router.get("/users", response_model=List[dict])
-async def get_users(skip: int = Query(0, ge=0), limit: int = Query(20, ge=1, le=100), search: Optional[str] = None, db: Session = Depends(get_db), current_user = Depends(get_current_admin_user)):
-    """Get all users"""
-    query = db.query(User)
-    if search: query = query.filter((User.username.ilike(f'%{search}%')) | (User.email.ilike(f'%{search}%')))
-    users = query.offset(skip).limit(limit).all()
-    return [{
+def _unindex_spots(conn, spot_ids: List[int], points) -> None:
+    remove_items(conn, "spot", spot_ids)
+    geo.remove_spots(conn, spot_ids)
+    clusters.remove_points(conn, points)
+
+@router.post("/spots/bulk-delete")
+async def bulk_delete_spots(selection: Union[List[int], SpotSelection], db: AsyncSession = Depends(get_db), current_user = Depends(get_current_admin_user)):
+    """Bulk delete spots (list of IDs, or IDs and/or filters)"""
+    spot_ids = await _select_ids(db, Spot, selection)
+    conn = await db.connection()
+    deleted = 0
+    for chunk in _chunks(spot_ids):
+        points = (await db.execute(select(Spot.latitude, Spot.longitude).where(Spot.id.in_(chunk)))).all()
+        deleted += (await db.execute(delete(Spot).where(Spot.id.in_(chunk)))).rowcount
+        await conn.run_sync(_unindex_spots, chunk, points)
+    await db.commit()
+    response_cache.invalidate("spots", *(f"spot:{i}" for i in spot_ids))
+    return {"message": f"{deleted} spots deleted", "deleted_count": deleted}
+
+@router.post("/users/bulk-delete")
+async def bulk_delete_users(selection: Union[List[int], UserSelection], db: AsyncSession = Depends(get_db), current_user = Depends(get_current_admin_user)):
+    """Bulk delete users with their comments (list of IDs, or IDs and/or filters).
+
+    Authors of articles and the current user are skipped."""
+    user_ids = [i for i in await _select_ids(db, User, selection) if i != current_user.id]
+    deleted = deleted_comments = 0
+    article_ids = set()
+    for chunk in _chunks(user_ids):
+        deletable = (await db.scalars(select(User.id).where(
+            User.id.in_(chunk), ~select(Article.id).where(Article.author_id == User.id).exists()
+        ))).all()
+        if not deletable:
+            continue
+        own_comments = select(Comment.id).where(Comment.author_id.in_(deletable))
+        article_ids.update((await db.scalars(select(Comment.article_id).where(Comment.author_id.in_(deletable)).distinct())).all())
+        # Replies to their comments go too (one list per statement: BULK_CHUNK_SIZE parameters at most)
+        deleted_comments += (await db.execute(delete(Comment).where(Comment.parent_id.in_(own_comments)))).rowcount
+        deleted_comments += (await db.execute(delete(Comment).where(Comment.author_id.in_(deletable)))).rowcount
+        deleted += (await db.execute(delete(User).where(User.id.in_(deletable)))).rowcount
+    await db.commit()
+    user_cache.invalidate(*user_ids)
+    response_cache.invalidate(*(f"comments:article:{i}" for i in article_ids))
+    return {"message": f"{deleted} users deleted", "deleted_count": deleted,
+            "skipped_count": len(user_ids) - deleted, "deleted_comments": deleted_comments}
+
+def _with_articles_count(query):
+    """Load User.articles_count in the same query, through a grouped LEFT JOIN on articles"""
+    counts = select(Article.author_id, func.count(Article.id).label("n")).group_by(Article.author_id).subquery()
+    return query.outerjoin(counts, counts.c.author_id == User.id) \
+        .options(with_expression(User.articles_count, func.coalesce(counts.c.n, 0))) \
+        .execution_options(populate_existing=True)
+
+
+def _format_user(u: User) -> dict:
+    return {
         "id": u.id, "username": u.username, "email": u.email, "full_name": u.full_name,
         "is_admin": u.is_admin, "created_at": u.created_at.isoformat() if u.created_at else None,
-        "articles_count": db.query(Article).filter(Article.author_id == u.id).count()
-    } for u in users]
+        "articles_count": u.articles_count
+    }
+
+
+async def _get_user_with_count(db: AsyncSession, user_id: int) -> User:
+    user = await db.scalar(_with_articles_count(select(User).where(User.id == user_id)))
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
+
+@router.get("/users", response_model=List[dict])
+async def get_users(response: Response, skip: int = Query(0, ge=0), limit: int = Query(20, ge=1, le=100), search: Optional[str] = None, cursor: Optional[str] = None, db: AsyncSession = Depends(get_db), current_user = Depends(get_current_admin_user)):
+    """Get all users (offset or keyset via `cursor`)"""
+    query = _with_articles_count(select(User))
+    if search: query = query.where((User.username.ilike(f'%{search}%')) | (User.email.ilike(f'%{search}%')))
+    if cursor is not None:
+        users, next_cursor = await keyset_page(db, query, User.created_at, User.id, cursor, limit)
+        if next_cursor: response.headers["X-Next-Cursor"] = next_cursor
+    else:
+        users = (await db.scalars(query.offset(skip).limit(limit))).all()
+    return [_format_user(u) for u in users]
 
 @router.get("/users/{user_id}")
-async def get_user(user_id: int, db: Session = Depends(get_db), current_user = Depends(get_current_admin_user)):
+async def get_user(user_id: int, db: AsyncSession = Depends(get_db), current_user = Depends(get_current_admin_user)):
     """Get user details"""
-    from app.utils import get_or_404
-    user = get_or_404(db, User, user_id)
-    return {
-        "id": user.id, "username": user.username, "email": user.email, "full_name": user.full_name,
-        "is_admin": user.is_admin, "created_at": user.created_at.isoformat() if user.created_at else None,
-        "articles_count": db.query(Article).filter(Article.author_id == user.id).count()
-    }
+    return _format_user(await _get_user_with_count(db, user_id))
 
 @router.put("/users/{user_id}")
-async def update_user(user_id: int, data: UserUpdate, db: Session = Depends(get_db), current_user = Depends(get_current_admin_user)):
+async def update_user(user_id: int, data: UserUpdate, db: AsyncSession = Depends(get_db), current_user = Depends(get_current_admin_user)):
     """Update user"""
-    from app.utils import get_or_404, update_model
-    user = get_or_404(db, User, user_id)
-    return update_model(db, user, data.dict(exclude_unset=True))
+    user = await get_or_404(db, User, user_id)
+    return await update_model(db, user, data.dict(exclude_unset=True))
 
 @router.post("/users/{user_id}/toggle-admin")
-async def toggle_admin(user_id: int, db: Session = Depends(get_db), current_user = Depends(get_current_admin_user)):
+async def toggle_admin(user_id: int, db: AsyncSession = Depends(get_db), current_user = Depends(get_current_admin_user)):
     """Toggle admin role"""
-    from app.utils import get_or_404
-    user = get_or_404(db, User, user_id)
+    user = await get_or_404(db, User, user_id)
     user.is_admin = not user.is_admin
-    db.commit()
+    # Tokens claiming the previous role are no longer accepted
+    user.token_version += 1
+    await db.commit()
     return {"message": f"Admin status: {user.is_admin}", "is_admin": user.is_admin}
 
 @router.delete("/users/{user_id}")
-async def delete_user(user_id: int, db: Session = Depends(get_db), current_user = Depends(get_current_admin_user)):
+async def delete_user(user_id: int, db: AsyncSession = Depends(get_db), current_user = Depends(get_current_admin_user)):
     """Delete user"""
-    from app.utils import get_or_404, delete_model
-    user = get_or_404(db, User, user_id)
-    if db.query(Article).filter(Article.author_id == user_id).count() > 0:
+    user = await _get_user_with_count(db, user_id)
+    if user.articles_count > 0:
         raise HTTPException(status_code=400, detail="Cannot delete user with articles")
-    return delete_model(db, user)
+    own_comments = select(Comment.id).where(Comment.author_id == user_id)
+    article_ids = (await db.scalars(select(Comment.article_id).where(Comment.author_id == user_id).distinct())).all()
+    await db.execute(delete(Comment).where((Comment.author_id == user_id) | Comment.parent_id.in_(own_comments)))
+    result = await delete_model(db, user)
+    response_cache.invalidate(*(f"comments:article:{i}" for i in article_ids))
+    return result
@@ -1,96 +1,188 @@
 """
 Articles API routes
 """
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, attributes
+from sqlalchemy import desc, select, delete
 from typing import List, Optional
 from datetime import datetime
 
 from app.database import get_db
-from app.models import Article, User, ArticleStatus
-from app.schemas import ArticleResponse, ArticleCreate, ArticleUpdate
+from app.models import Article, User, Comment, ArticleStatus
+from app.schemas import ArticleResponse, ArticleCreate, ArticleUpdate, CommentCreate, CommentResponse, CommentPage
 from app.auth import get_current_user, get_current_admin_user
-from app.utils import get_or_404, update_model, create_slug, ensure_unique_slug, add_author_name
+from app.utils import get_or_404, update_model, create_slug, ensure_unique_slug, keyset_page
+from app.views import view_counter
+from app.cache import cached_json, cache_key, get_or_build
+from app.conditional import list_response, row_validators
+from app.render import regenerate, page_cache
+from app.serialization import json_response, loads, from_row
 
 router = APIRouter()
 
 
 @router.get("/", response_model=List[ArticleResponse])
 async def get_articles(
+    request: Request,
     skip: int = Query(0, ge=0),
     limit: int = Query(10, ge=1, le=100),
     status: Optional[ArticleStatus] = None,
     category: Optional[str] = None,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
 ):
-    """Get list of articles"""
-    query = db.query(Article)
+    """Get list of articles (pass `cursor`, empty for the first page, to paginate by keyset)"""
+    query = select(Article).options(joinedload(Article.author))
     
     # Filter by status (default: only published for non-admin)
     if status:
-        query = query.filter(Article.status == status)
+        query = query.where(Article.status == status)
     else:
-        query = query.filter(Article.status == ArticleStatus.PUBLISHED)
+        query = query.where(Article.status == ArticleStatus.PUBLISHED)
     
     # Filter by category
     if category:
-        query = query.filter(Article.category == category)
+        query = query.where(Article.category == category)
     
-    articles = query.order_by(desc(Article.published_at)).offset(skip).limit(limit).all()
+    if cursor is not None:
+        articles, next_cursor = await keyset_page(db, query, Article.published_at, Article.id, cursor, limit)
+        page = json_response([_format(a) for a in articles])
+        if next_cursor:
+            page.headers["X-Next-Cursor"] = next_cursor
+        return list_response(request, page)
     
-    return [ArticleResponse(**add_author_name({**a.__dict__}, a.author)) for a in articles]
+    async def build():
+        articles = await db.scalars(query.order_by(desc(Article.published_at)).offset(skip).limit(limit))
+        return [_format(a) for a in articles]
+    return list_response(request, await cached_json(cache_key("articles", request.query_params), ["articles"], build))
 
 
-def _increment_views_and_format(article: Article, db: Session) -> ArticleResponse:
-    """Helper to increment views and format response"""
-    article.views += 1
-    db.commit()
-    db.refresh(article)
-    article_dict = add_author_name({**article.__dict__}, article.author)
-    return ArticleResponse(**article_dict)
+def _format(article: Article) -> ArticleResponse:
+    return from_row(ArticleResponse, article)
+
+
+async def _record_view(request: Request, db: AsyncSession, key: str, condition):
+    """Helper to record a view and serve the article, from the cache, with pending views
+    added (flushed in batches), or as a 304 when the client copy is current"""
+    found = await row_validators(db, Article, condition, Article.views)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Article not found")
+    article_id, validators = found
+    view_counter.increment(article_id)
+    if validators.matches(request):
+        return validators.not_modified()
+    async def build():
+        return _format(await get_or_404(db, Article, article_id, joinedload(Article.author)))
+    body = await get_or_build(key, lambda a: [f"article:{a.id}", f"author:{a.author_id}"], build)
+    pending = view_counter.pending(article_id)
+    if not pending:
+        return validators.apply(Response(content=body, media_type="application/json"))
+    article = loads(body)
+    article["views"] += pending
+    return validators.apply(json_response(article))
 
 
 @router.get("/{article_id}", response_model=ArticleResponse)
-async def get_article(article_id: int, db: Session = Depends(get_db)):
+async def get_article(article_id: int, request: Request, db: AsyncSession = Depends(get_db)):
     """Get a single article by ID"""
-    article = get_or_404(db, Article, article_id)
-    return _increment_views_and_format(article, db)
+    return await _record_view(request, db, f"article:{article_id}", Article.id == article_id)
 
 
 @router.get("/slug/{slug}", response_model=ArticleResponse)
-async def get_article_by_slug(slug: str, db: Session = Depends(get_db)):
+async def get_article_by_slug(slug: str, request: Request, db: AsyncSession = Depends(get_db)):
     """Get a single article by slug"""
-    article = db.query(Article).filter(Article.slug == slug).first()
-    if not article:
+    return await _record_view(request, db, f"article:slug:{slug}", Article.slug == slug)
+
+
+def _format_comment(comment: Comment) -> CommentResponse:
+    return CommentResponse.model_validate(comment)
+
+
+async def _published_article_id(db: AsyncSession, article_id: int) -> int:
+    found = await db.scalar(select(Article.id).where(Article.id == article_id, Article.status == ArticleStatus.PUBLISHED))
+    if found is None:
         raise HTTPException(status_code=404, detail="Article not found")
-    return _increment_views_and_format(article, db)
+    return found
+
+
+@router.get("/{article_id}/comments", response_model=CommentPage)
+async def get_article_comments(
+    article_id: int,
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_db)
+):
+    """Approved comments of an article, newest threads first with their replies (pass `next_cursor` back as `cursor`)"""
+    async def build():
+        await _published_article_id(db, article_id)
+        approved = select(Comment).options(joinedload(Comment.author).load_only(User.username, User.full_name)) \
+            .where(Comment.is_approved == True)
+        roots = approved.where(Comment.article_id == article_id, Comment.parent_id.is_(None))
+        roots, next_cursor = await keyset_page(db, roots, Comment.created_at, Comment.id, cursor or "", limit)
+        threads = {c.id: _format_comment(c) for c in roots}
+        if threads:
+            # Replies belong to the article of their thread: looked up by parent_id (ix_comments_parent_id),
+            # sorted here since an ORDER BY makes SQLite prefer the index of all approved comments
+            replies = (await db.scalars(approved.where(Comment.parent_id.in_(threads)))).all()
+            for reply in sorted(replies, key=lambda c: (c.created_at, c.id)):
+                threads[reply.parent_id].replies.append(_format_comment(reply))
+        return CommentPage(items=list(threads.values()), next_cursor=next_cursor)
+    # "articles" drops the lists when an article is unpublished or deleted
+    return list_response(request, await cached_json(cache_key(f"article:{article_id}:comments", request.query_params),
+                                                    [f"comments:article:{article_id}", "articles"], build))
+
+
+@router.post("/{article_id}/comments", response_model=CommentResponse)
+async def create_article_comment(
+    article_id: int,
+    comment: CommentCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Comment an article or reply to one of its comments (visible once approved)"""
+    await _published_article_id(db, article_id)
+    parent_id = None
+    if comment.parent_id is not None:
+        parent = await db.get(Comment, comment.parent_id)
+        if parent is None or parent.article_id != article_id:
+            raise HTTPException(status_code=400, detail="Invalid parent comment")
+        # A reply to a reply joins the thread of its root
+        parent_id = parent.parent_id or parent.id
+    db_comment = Comment(content=comment.content, article_id=article_id, author_id=current_user.id, parent_id=parent_id, is_approved=False)
+    db.add(db_comment)
+    await db.commit()
+    await db.refresh(db_comment)
+    attributes.set_committed_value(db_comment, "author", current_user)
+    return json_response(_format_comment(db_comment))
 
 
 @router.post("/", response_model=ArticleResponse)
 async def create_article(
     article: ArticleCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Create a new article"""
-    slug = ensure_unique_slug(db, Article, create_slug(article.title))
+    slug = await ensure_unique_slug(db, Article, create_slug(article.title))
     db_article = Article(**article.dict(), slug=slug, author_id=current_user.id, status=ArticleStatus.DRAFT)
     db.add(db_article)
-    db.commit()
-    db.refresh(db_article)
-    return ArticleResponse(**add_author_name({**db_article.__dict__}, current_user))
+    await db.commit()
+    await db.refresh(db_article)
+    attributes.set_committed_value(db_article, "author", current_user)
+    return json_response(_format(db_article))
 
 
 @router.put("/{article_id}", response_model=ArticleResponse)
 async def update_article(
     article_id: int,
     article_update: ArticleUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Update an article"""
-    db_article = get_or_404(db, Article, article_id)
+    db_article = await get_or_404(db, Article, article_id, joinedload(Article.author))
     if db_article.author_id != current_user.id and not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized")
     
@@ -98,16 +190,22 @@ async def update_article(
     if update_data.get("status") == ArticleStatus.PUBLISHED and not db_article.published_at:
         update_data["published_at"] = datetime.now()
     
-    update_model(db, db_article, update_data)
-    return ArticleResponse(**add_author_name({**db_article.__dict__}, db_article.author))
+    await update_model(db, db_article, update_data)
+    await regenerate(db, db_article)
+    return json_response(_format(db_article))
 
 
 @router.delete("/{article_id}")
 async def delete_article(
     article_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_admin_user)
 ):
-    """Delete an article (admin only)"""
+    """Delete an article and its comments (admin only)"""
     from app.utils import delete_model
-    return delete_model(db, get_or_404(db, Article, article_id))
+    article = await get_or_404(db, Article, article_id)
+    view_counter.discard(article_id)
+    await db.execute(delete(Comment).where(Comment.article_id == article_id))
+    result = await delete_model(db, article)
+    page_cache.remove(f"article-{article_id}")
+    return result
@@ -1,11 +1,12 @@
 """
 Base CRUD operations for routers
 """
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional, Type, TypeVar, Generic
 from app.database import get_db
-from app.utils import get_or_404, update_model, delete_model
+from app.utils import get_or_404, update_model, delete_model, keyset_page
 
 ModelType = TypeVar("ModelType")
 CreateSchemaType = TypeVar("CreateSchemaType")
@@ -43,14 +44,22 @@ class CRUDRouter(Generic[ModelType, CreateSchemaType, UpdateSchemaType, Response
         async def get_items(
             skip: int = Query(0, ge=0),
             limit: int = Query(100, ge=1, le=500),
-            db: Session = Depends(get_db)
+            cursor: Optional[str] = None,
+            response: Response = None,
+            db: AsyncSession = Depends(get_db)
         ):
-            return db.query(self.model).offset(skip).limit(limit).all()
+            if cursor is not None:
+                sort_column = getattr(self.model, "created_at", self.model.id)
+                items, next_cursor = await keyset_page(db, select(self.model), sort_column, self.model.id, cursor, limit)
+                if next_cursor:
+                    response.headers["X-Next-Cursor"] = next_cursor
+                return items
+            return (await db.scalars(select(self.model).offset(skip).limit(limit))).all()
         
         # Get by ID
         @self.router.get("/{item_id}", response_model=self.response_schema)
-        async def get_item(item_id: int, db: Session = Depends(get_db)):
-            return get_or_404(db, self.model, item_id)
+        async def get_item(item_id: int, db: AsyncSession = Depends(get_db)):
+            return await get_or_404(db, self.model, item_id)
         
         # Create
         create_deps = [Depends(get_db)]
@@ -62,13 +71,13 @@ class CRUDRouter(Generic[ModelType, CreateSchemaType, UpdateSchemaType, Response
         @self.router.post("/", response_model=self.response_schema)
         async def create_item(
             item: self.create_schema,
-            db: Session = Depends(get_db),
+            db: AsyncSession = Depends(get_db),
             **kwargs
         ):
             db_item = self.model(**item.dict())
             db.add(db_item)
-            db.commit()
-            db.refresh(db_item)
+            await db.commit()
+            await db.refresh(db_item)
             return db_item
         
         # Update
@@ -76,12 +85,12 @@ class CRUDRouter(Generic[ModelType, CreateSchemaType, UpdateSchemaType, Response
         async def update_item(
             item_id: int,
             item_update: self.update_schema,
-            db: Session = Depends(get_db),
+            db: AsyncSession = Depends(get_db),
             **kwargs
         ):
-            db_item = get_or_404(db, self.model, item_id)
+            db_item = await get_or_404(db, self.model, item_id)
             update_data = item_update.dict(exclude_unset=True)
-            return update_model(db, db_item, update_data)
+            return await update_model(db, db_item, update_data)
         
         # Delete
         delete_deps = [Depends(get_db)]
@@ -91,8 +100,8 @@ class CRUDRouter(Generic[ModelType, CreateSchemaType, UpdateSchemaType, Response
         @self.router.delete("/{item_id}")
         async def delete_item(
             item_id: int,
-            db: Session = Depends(get_db),
+            db: AsyncSession = Depends(get_db),
             **kwargs
         ):
-            db_item = get_or_404(db, self.model, item_id)
-            return delete_model(db, db_item)
+            db_item = await get_or_404(db, self.model, item_id)
+            return await delete_model(db, db_item)
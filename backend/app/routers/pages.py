@@ -0,0 +1,40 @@
+"""
+Server-side rendered public pages
+"""
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse, HTMLResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import get_db
+from app.render import home_page, article_page, SHELL_PATH
+from app.views import view_counter
+from app.conditional import LIST_CACHE_CONTROL, DETAIL_CACHE_CONTROL
+
+router = APIRouter()
+
+
+def _html(path, page, cache_control: str):
+    headers = {"Cache-Control": cache_control}
+    if path:
+        return FileResponse(path, media_type="text/html", headers=headers)
+    return HTMLResponse(page, headers=headers)
+
+
+@router.get("/", include_in_schema=False)
+async def read_root(db: AsyncSession = Depends(get_db)):
+    """Serve the homepage with the latest articles"""
+    found = await home_page(db)
+    if found is None:
+        return {"message": "LUMIÈRE API is running", "html_path": SHELL_PATH}
+    return _html(*found, LIST_CACHE_CONTROL)
+
+
+@router.get("/articles/{slug}", include_in_schema=False)
+async def read_article(slug: str, db: AsyncSession = Depends(get_db)):
+    """Serve a published article (counts a view)"""
+    found = await article_page(db, slug)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Article not found")
+    article_id, path, page = found
+    view_counter.increment(article_id)
+    return _html(path, page, DETAIL_CACHE_CONTROL)
@@ -0,0 +1,48 @@
+"""
+Search API routes
+"""
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Literal
+
+from app.database import get_db
+from app.models import Article, Spot, ArticleStatus
+from app.schemas import SearchResult
+from app.search import ranked_ids, search_filter
+
+router = APIRouter()
+
+
+async def _search(db: AsyncSession, kind: str, q: str, limit: int) -> List[SearchResult]:
+    """Run a ranked search for one kind of item"""
+    model = Article if kind == "article" else Spot
+    query = select(model)
+    if kind == "article":
+        query = query.where(model.status == ArticleStatus.PUBLISHED)
+    ranked = ranked_ids(db, kind, q)
+    if ranked is None:
+        columns = (Article.title, Article.content) if kind == "article" else (Spot.name, Spot.location)
+        items = (await db.scalars(query.where(search_filter(db, kind, q, *columns)).limit(limit))).all()
+        scores = {item.id: 0.0 for item in items}
+    else:
+        matches = ranked.subquery("matches")
+        rows = (await db.execute(query.join(matches, matches.c.ref_id == model.id).add_columns(matches.c.score)
+                                 .order_by(matches.c.score.desc()).limit(limit))).all()
+        items, scores = [item for item, _ in rows], {item.id: score for item, score in rows}
+    if kind == "article":
+        return [SearchResult(kind=kind, id=a.id, title=a.title, excerpt=a.excerpt, slug=a.slug, score=scores[a.id]) for a in items]
+    return [SearchResult(kind=kind, id=s.id, title=s.name, excerpt=s.location, score=scores[s.id]) for s in items]
+
+
+@router.get("/", response_model=List[SearchResult])
+async def search(
+    q: str = Query(..., min_length=2),
+    kind: Optional[Literal["article", "spot"]] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_db)
+):
+    """Search published articles and spots, best matches first"""
+    kinds = [kind] if kind else ["article", "spot"]
+    results = [r for k in kinds for r in await _search(db, k, q, limit)]
+    return sorted(results, key=lambda r: r.score, reverse=True)[:limit]
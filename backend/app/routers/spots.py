@@ -1,63 +1,154 @@
 """
 Spots API routes
 """
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
+import hashlib
+import struct
 
 from app.database import get_db
 from app.models import Spot, SpotCategory
 from app.schemas import SpotResponse, SpotCreate, SpotUpdate
 from app.auth import get_current_admin_user
-from app.utils import get_or_404, update_model, delete_model
+from app.utils import get_or_404, update_model, delete_model, keyset_page
+from app.search import search_filter
+from app.geo import parse_bbox, parse_point, bbox_around, bbox_filter, haversine_km
+from app.clusters import get_clusters
+from app.cache import cached_json, cache_key
+from app.serialization import json_response, from_row
+from app.conditional import list_response, row_validators
 
 router = APIRouter()
 
 
 @router.get("/", response_model=List[SpotResponse])
 async def get_spots(
+    request: Request,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=500),
     category: Optional[SpotCategory] = None,
     search: Optional[str] = None,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    bbox: Optional[str] = Query(None, description="minLon,minLat,maxLon,maxLat"),
+    near: Optional[str] = Query(None, description="lat,lon"),
+    radius_km: float = Query(10.0, gt=0, le=20000),
+    db: AsyncSession = Depends(get_db)
 ):
-    """Get list of spots"""
-    query = db.query(Spot)
+    """Get list of spots (pass `cursor`, empty for the first page, to paginate by keyset).
+
+    `bbox` keeps spots in the viewport; `near` returns spots within `radius_km`, closest first
+    (paginated with `skip`: keyset pages follow the rating order)."""
+    if near and cursor is not None:
+        raise HTTPException(status_code=400, detail="near cannot be combined with cursor, paginate with skip")
+    query = select(Spot)
+    if bbox:
+        query = query.where(bbox_filter(db, parse_bbox(bbox)))
     
     # Filter by category
     if category:
-        query = query.filter(Spot.category == category)
+        query = query.where(Spot.category == category)
     
-    # Search by name or location
+    # Full-text search on name, location and description
     if search:
-        search_term = f"%{search}%"
-        query = query.filter(
-            (Spot.name.ilike(search_term)) | 
-            (Spot.location.ilike(search_term))
-        )
+        query = query.where(search_filter(db, "spot", search, Spot.name, Spot.location))
+    
+    if cursor is not None:
+        spots, next_cursor = await keyset_page(db, query, Spot.rating, Spot.id, cursor, limit)
+        page = json_response([from_row(SpotResponse, s) for s in spots])
+        if next_cursor:
+            page.headers["X-Next-Cursor"] = next_cursor
+        return list_response(request, page)
     
-    spots = query.order_by(Spot.rating.desc()).offset(skip).limit(limit).all()
-    return spots
+    async def build():
+        if near:
+            lat, lon = parse_point(near)
+            candidates = (await db.scalars(query.where(bbox_filter(db, bbox_around(lat, lon, radius_km))))).all()
+            for spot in candidates:
+                spot.distance_km = round(haversine_km(lat, lon, spot.latitude, spot.longitude), 3)
+            spots = sorted((s for s in candidates if s.distance_km <= radius_km), key=lambda s: (s.distance_km, s.id))[skip:skip + limit]
+        else:
+            spots = await db.scalars(query.order_by(Spot.rating.desc()).offset(skip).limit(limit))
+        return [from_row(SpotResponse, s) for s in spots]
+    return list_response(request, await cached_json(cache_key("spots", request.query_params), ["spots"], build))
+
+
+@router.get("/clusters")
+async def get_spot_clusters(
+    bbox: str = Query(..., description="minLon,minLat,maxLon,maxLat"),
+    zoom: int = Query(..., ge=0, le=22),
+    limit: int = Query(2000, ge=1, le=10000),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get marker clusters (centroid and count) of the spots in a viewport"""
+    return await get_clusters(db, parse_bbox(bbox), zoom, limit)
+
+
+# Category byte of the map feed: 0 = none, then SpotCategory in declaration order
+MAP_CATEGORIES = [None] + list(SpotCategory)
+
+
+def _pack_map_feed(rows) -> bytes:
+    """Columnar little-endian feed: count (uint32), ids (uint32[]), latitudes (float32[]),
+    longitudes (float32[]), categories (uint8[]), ratings x10 (uint8[])"""
+    n = len(rows)
+    return b"".join([
+        struct.pack("<I", n),
+        struct.pack(f"<{n}I", *(r.id for r in rows)),
+        struct.pack(f"<{n}f", *(r.latitude for r in rows)),
+        struct.pack(f"<{n}f", *(r.longitude for r in rows)),
+        bytes(MAP_CATEGORIES.index(r.category) for r in rows),
+        bytes(min(255, max(0, round((r.rating or 0) * 10))) for r in rows),
+    ])
+
+
+@router.get("/map")
+async def get_spots_map(
+    request: Request,
+    bbox: Optional[str] = Query(None, description="minLon,minLat,maxLon,maxLat"),
+    category: Optional[SpotCategory] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """Get the compact binary feed drawn by the map (details via GET /api/spots/{id})"""
+    query = select(Spot.id, Spot.latitude, Spot.longitude, Spot.category, Spot.rating)
+    if bbox:
+        query = query.where(bbox_filter(db, parse_bbox(bbox)))
+    if category:
+        query = query.where(Spot.category == category)
+    payload = _pack_map_feed((await db.execute(query.order_by(Spot.id))).all())
+    etag = '"' + hashlib.sha1(payload).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": "public, no-cache"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return Response(content=payload, media_type="application/octet-stream", headers=headers)
 
 
 @router.get("/{spot_id}", response_model=SpotResponse)
-async def get_spot(spot_id: int, db: Session = Depends(get_db)):
+async def get_spot(spot_id: int, request: Request, db: AsyncSession = Depends(get_db)):
     """Get a single spot by ID"""
-    return get_or_404(db, Spot, spot_id)
+    found = await row_validators(db, Spot, Spot.id == spot_id)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Spot not found")
+    validators = found[1]
+    if validators.matches(request):
+        return validators.not_modified()
+    async def build():
+        return from_row(SpotResponse, await get_or_404(db, Spot, spot_id))
+    return validators.apply(await cached_json(f"spot:{spot_id}", [f"spot:{spot_id}"], build))
 
 
 @router.post("/", response_model=SpotResponse)
 async def create_spot(
     spot: SpotCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_admin_user)
 ):
     """Create a new spot (admin only)"""
     db_spot = Spot(**spot.dict())
     db.add(db_spot)
-    db.commit()
-    db.refresh(db_spot)
+    await db.commit()
+    await db.refresh(db_spot)
     return db_spot
 
 
@@ -65,19 +156,19 @@ async def create_spot(
 async def update_spot(
     spot_id: int,
     spot_update: SpotUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_admin_user)
 ):
     """Update a spot (admin only)"""
-    db_spot = get_or_404(db, Spot, spot_id)
-    return update_model(db, db_spot, spot_update.dict(exclude_unset=True))
+    db_spot = await get_or_404(db, Spot, spot_id)
+    return await update_model(db, db_spot, spot_update.dict(exclude_unset=True))
 
 
 @router.delete("/{spot_id}")
 async def delete_spot(
     spot_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_admin_user)
 ):
     """Delete a spot (admin only)"""
-    return delete_model(db, get_or_404(db, Spot, spot_id))
+    return await delete_model(db, await get_or_404(db, Spot, spot_id))
@@ -83,6 +83,7 @@ class SpotResponse(SpotBase):
     id: int
     created_at: datetime
     updated_at: Optional[datetime] = None
+    distance_km: Optional[float] = None  # only set for `near` queries
 
     class Config:
         from_attributes = True
@@ -124,7 +125,7 @@ class CommentBase(BaseModel):
 
 
 class CommentCreate(CommentBase):
-    article_id: int
+    parent_id: Optional[int] = None
 
 
 class CommentResponse(CommentBase):
@@ -132,18 +133,60 @@ class CommentResponse(CommentBase):
     article_id: int
     author_id: int
     author_name: Optional[str] = None
+    parent_id: Optional[int] = None
     created_at: datetime
     is_approved: bool
+    replies: List["CommentResponse"] = []
 
     class Config:
         from_attributes = True
 
 
+class CommentPage(BaseModel):
+    items: List[CommentResponse]
+    next_cursor: Optional[str] = None
+
+
 # Newsletter Schema
 class NewsletterSubscribe(BaseModel):
     email: EmailStr
 
+# Search Schema
+class SearchResult(BaseModel):
+    kind: str
+    id: int
+    title: str
+    excerpt: Optional[str] = None
+    slug: Optional[str] = None
+    score: float
+
+
 # Admin User Update Schema
 class UserUpdate(BaseModel):
     email: Optional[EmailStr] = None
     full_name: Optional[str] = None
+
+
+# Admin bulk selections: explicit IDs and/or filters (both given: the IDs matching the filters)
+class BulkSelection(BaseModel):
+    ids: Optional[List[int]] = None
+    created_before: Optional[datetime] = None
+
+
+class CommentSelection(BulkSelection):
+    is_approved: Optional[bool] = None
+    article_id: Optional[int] = None
+
+
+class ArticleSelection(BulkSelection):
+    status: Optional[ArticleStatus] = None
+    category: Optional[str] = None
+    author_id: Optional[int] = None
+
+
+class SpotSelection(BulkSelection):
+    category: Optional[SpotCategory] = None
+
+
+class UserSelection(BulkSelection):
+    is_admin: Optional[bool] = None
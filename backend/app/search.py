@@ -0,0 +1,141 @@
+"""
+Full-text search over articles and spots
+
+SQLite uses an FTS5 table (unicode61 tokenizer with diacritics removed) ranked by
+bm25; PostgreSQL uses a table holding an unaccented, French-stemmed tsvector with
+a GIN index, ranked by ts_rank. Other databases fall back to ILIKE.
+The index is kept in sync by ORM events on Article and Spot.
+"""
+import re
+from typing import Iterable, List, Tuple
+from sqlalchemy import event, text, select, Integer, Float, or_
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Article, Spot
+
+# kind -> (model, code used to build the FTS5 rowid)
+KINDS = {"article": (Article, 0), "spot": (Spot, 1)}
+
+# kind -> indexed columns, the title first
+FIELDS = {"article": ("title", "excerpt", "category", "content"), "spot": ("name", "location", "description", "tags", "best_time")}
+
+
+def _document(kind: str, item) -> Tuple[str, str]:
+    """Title and body indexed for an item"""
+    title, *body = (getattr(item, name) for name in FIELDS[kind])
+    return title, " ".join(filter(None, body))
+
+
+def _rowid(kind: str, item_id: int) -> int:
+    return item_id * len(KINDS) + KINDS[kind][1]
+
+
+def _terms(query: str) -> List[str]:
+    return re.findall(r"\w+", query)
+
+
+def _fts5_query(query: str) -> str:
+    """Prefix match on every term, implicit AND"""
+    return " ".join(f'"{t}"*' for t in _terms(query))
+
+
+def _tsquery(query: str) -> str:
+    return " & ".join(f"{t}:*" for t in _terms(query))
+
+
+def create_index(conn: Connection) -> None:
+    """Create the search storage for the current database"""
+    if conn.dialect.name == "sqlite":
+        conn.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+            "kind UNINDEXED, ref_id UNINDEXED, title, body, tokenize = 'unicode61 remove_diacritics 2')"
+        ))
+    elif conn.dialect.name == "postgresql":
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS unaccent"))
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS search_index ("
+            "kind VARCHAR NOT NULL, ref_id INTEGER NOT NULL, document TSVECTOR NOT NULL, PRIMARY KEY (kind, ref_id))"
+        ))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_search_index_document ON search_index USING GIN (document)"))
+
+
+def index_item(conn: Connection, kind: str, item) -> None:
+    """Add or replace an item in the search index"""
+    title, body = _document(kind, item)
+    if conn.dialect.name == "sqlite":
+        rowid = _rowid(kind, item.id)
+        conn.execute(text("DELETE FROM search_index WHERE rowid = :rowid"), {"rowid": rowid})
+        conn.execute(
+            text("INSERT INTO search_index (rowid, kind, ref_id, title, body) VALUES (:rowid, :kind, :ref_id, :title, :body)"),
+            {"rowid": rowid, "kind": kind, "ref_id": item.id, "title": title, "body": body}
+        )
+    elif conn.dialect.name == "postgresql":
+        conn.execute(text(
+            "INSERT INTO search_index (kind, ref_id, document) VALUES (:kind, :ref_id, "
+            "setweight(to_tsvector('french', unaccent(:title)), 'A') || setweight(to_tsvector('french', unaccent(:body)), 'B')) "
+            "ON CONFLICT (kind, ref_id) DO UPDATE SET document = EXCLUDED.document"
+        ), {"kind": kind, "ref_id": item.id, "title": title, "body": body})
+
+
+def remove_items(conn: Connection, kind: str, item_ids: Iterable[int]) -> None:
+    """Remove items from the search index"""
+    item_ids = list(item_ids)
+    if not item_ids:
+        return
+    if conn.dialect.name == "sqlite":
+        conn.execute(text("DELETE FROM search_index WHERE rowid = :rowid"), [{"rowid": _rowid(kind, i)} for i in item_ids])
+    elif conn.dialect.name == "postgresql":
+        conn.execute(text("DELETE FROM search_index WHERE kind = :kind AND ref_id = ANY(:ids)"), {"kind": kind, "ids": item_ids})
+
+
+def rebuild_index(conn: Connection) -> None:
+    """Index every article and spot from scratch"""
+    if conn.dialect.name not in ("sqlite", "postgresql"):
+        return
+    conn.execute(text("DELETE FROM search_index"))
+    for kind, (model, _) in KINDS.items():
+        # Only the indexed columns: this runs in a migration, before later ones add theirs
+        columns = [model.__table__.c[name] for name in ("id",) + FIELDS[kind]]
+        for item in conn.execute(select(*columns)).all():
+            index_item(conn, kind, item)
+
+
+def ranked_ids(db: AsyncSession, kind: str, query: str):
+    """Select (ref_id, score) of matching items, best first, or None if full-text search is unavailable"""
+    dialect = db.get_bind().dialect.name
+    if not _terms(query) or dialect not in ("sqlite", "postgresql"):
+        return None
+    if dialect == "sqlite":
+        sql = ("SELECT ref_id, -bm25(search_index, 0, 0, 10.0, 1.0) AS score FROM search_index "
+               "WHERE search_index MATCH :q AND kind = :kind ORDER BY score DESC")
+        params = {"q": _fts5_query(query), "kind": kind}
+    else:
+        sql = ("SELECT ref_id, ts_rank(document, to_tsquery('french', unaccent(:q))) AS score FROM search_index "
+               "WHERE kind = :kind AND document @@ to_tsquery('french', unaccent(:q)) ORDER BY score DESC")
+        params = {"q": _tsquery(query), "kind": kind}
+    return text(sql).bindparams(**params).columns(ref_id=Integer, score=Float)
+
+
+def search_filter(db: AsyncSession, kind: str, query: str, *columns):
+    """Filter expression restricting a query to matching items (ILIKE on columns as fallback)"""
+    ranked = ranked_ids(db, kind, query)
+    if ranked is None:
+        return or_(*(c.ilike(f"%{query}%") for c in columns))
+    return KINDS[kind][0].id.in_(select(ranked.subquery("matches").c.ref_id))
+
+
+def _sync(kind: str):
+    def after_save(mapper, connection, target):
+        index_item(connection, kind, target)
+
+    def after_delete(mapper, connection, target):
+        remove_items(connection, kind, [target.id])
+    return after_save, after_delete
+
+
+for _kind, (_model, _) in KINDS.items():
+    _after_save, _after_delete = _sync(_kind)
+    event.listen(_model, "after_insert", _after_save)
+    event.listen(_model, "after_update", _after_save)
+    event.listen(_model, "after_delete", _after_delete)
@@ -0,0 +1,46 @@
+"""
+JSON encoding of API responses
+
+Response models are built once from the loaded values of the ORM rows
+(from_row) and encoded by pydantic-core, inside lists and dicts encoded by
+orjson. Hot endpoints return the encoded Response themselves, so FastAPI
+neither validates the trusted data again against response_model nor walks it
+with jsonable_encoder; other endpoints go through ORJSONResponse, the default
+response class.
+"""
+from typing import Any, Type, TypeVar
+import orjson
+from fastapi import Response
+from pydantic import BaseModel
+
+M = TypeVar("M", bound=BaseModel)
+
+
+def from_row(schema: Type[M], row: Any) -> M:
+    """Model of an ORM row validated from its loaded values (row.__dict__), which is about
+    twice as fast as reading the instrumented attributes; fields not loaded and properties
+    (author_name) are read as attributes, the others keep their defaults"""
+    values = row.__dict__
+    missing = [name for name in schema.model_fields if name not in values and hasattr(row, name)]
+    if missing:
+        values = {**values, **{name: getattr(row, name) for name in missing}}
+    return schema.model_validate(values)
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        return orjson.Fragment(obj.__pydantic_serializer__.to_json(obj))
+    raise TypeError(f"{type(obj).__name__} is not JSON serializable")
+
+
+def dumps(data: Any) -> bytes:
+    """Encode models, lists and dicts of them (datetimes, enums and UUIDs natively)"""
+    return orjson.dumps(data, default=_default)
+
+
+loads = orjson.loads
+
+
+def json_response(data: Any, **kwargs) -> Response:
+    """Response with already validated data encoded as is"""
+    return Response(content=dumps(data), media_type="application/json", **kwargs)
@@ -0,0 +1,228 @@
+"""
+Admin dashboard statistics
+
+The counters are computed by a single query and kept as a snapshot. Committed
+ORM writes to the counted tables and view counter flushes add their deltas to
+it; bulk UPDATE/DELETE statements on those tables, or rows whose counted
+values were not loaded, mark it stale. It is recomputed anyway once older than
+STATS_MAX_AGE, which also moves the "last month" windows. Views not yet flushed
+by the view counter are added when the snapshot is served.
+
+daily_stats keeps per-day totals of the METRICS: views are added by the view
+counter flush, new spots, comments and (re)subscriptions by ORM events, so
+time series are read from a few rows per day instead of the raw tables.
+"""
+import os
+import time
+import threading
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+from sqlalchemy import event, func, inspect, insert, literal, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.models import Article, Spot, Newsletter, Comment, DailyStat
+from app.utils import upsert_add
+
+STATS_MAX_AGE = float(os.getenv("STATS_MAX_AGE", "300"))
+
+# Columns each counted model contributes to the counters with
+COUNTED = {Article: ("views",), Spot: ("created_at",), Newsletter: ("is_active", "subscribed_at"), Comment: ("is_approved",)}
+COUNTED_TABLES = {model.__tablename__ for model in COUNTED}
+
+METRICS = ("views", "subscribers", "spots", "comments")
+
+daily = DailyStat.__table__
+
+
+def _count(column, *conditions):
+    return select(func.count(column)).where(*conditions).scalar_subquery()
+
+
+async def compute_stats(db: AsyncSession) -> dict:
+    """All dashboard counters in one round trip"""
+    last_month = datetime.utcnow() - timedelta(days=30)
+    row = (await db.execute(select(
+        select(func.coalesce(func.sum(Article.views), 0)).scalar_subquery().label("total_views"),
+        select(func.coalesce(func.sum(DailyStat.value), 0)).where(
+            DailyStat.metric == "views", DailyStat.day >= last_month.date()
+        ).scalar_subquery().label("views_last_month"),
+        _count(Spot.id).label("total_spots"),
+        _count(Spot.id, Spot.created_at >= last_month).label("spots_last_month"),
+        _count(Newsletter.id, Newsletter.is_active == True).label("total_subscribers"),
+        _count(Newsletter.id, Newsletter.is_active == True, Newsletter.subscribed_at >= last_month).label("subs_last_month"),
+        _count(Comment.id, Comment.is_approved == False).label("pending_comments"),
+    ))).one()
+    return dict(row._mapping)
+
+
+class StatsSnapshot:
+    """Last computed counters and when they were computed"""
+
+    def __init__(self, max_age: float = STATS_MAX_AGE):
+        self.max_age = max_age
+        self._data: Optional[dict] = None
+        self._computed_at: Optional[datetime] = None
+        self._expires_at = 0.0
+        self._changes = 0
+        self._lock = threading.Lock()
+
+    async def get(self, db: AsyncSession) -> tuple:
+        """(counters, computed_at), recomputed if stale"""
+        if self._data is None or self._expires_at < time.monotonic():
+            changes = self._changes
+            data, computed_at = await compute_stats(db), datetime.utcnow()
+            with self._lock:
+                # Not kept if a change landed during the query: it may or may not be counted
+                if changes == self._changes:
+                    self._data, self._computed_at = data, computed_at
+                    self._expires_at = time.monotonic() + self.max_age
+            return data, computed_at
+        return self._data, self._computed_at
+
+    def add(self, **deltas: int) -> None:
+        """Add committed changes to the counters"""
+        with self._lock:
+            self._changes += 1
+            if self._data is not None:
+                self._data = {name: value + deltas.get(name, 0) for name, value in self._data.items()}
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._changes += 1
+            self._data = None
+
+
+stats_snapshot = StatsSnapshot()
+
+
+def add_daily(conn: Connection, metric: str, n: int = 1, day: Optional[date] = None) -> None:
+    """Add n to a metric for a day (today, UTC, by default)"""
+    upsert_add(conn, daily, {"metric": metric, "day": day or datetime.utcnow().date()}, {"value": n})
+
+
+def rebuild_daily(conn: Connection) -> None:
+    """Recompute the daily totals of spots, comments and subscribers from their tables (views have no history)"""
+    conn.execute(daily.delete().where(daily.c.metric != "views"))
+    for metric, column in (("spots", Spot.created_at), ("comments", Comment.created_at), ("subscribers", Newsletter.subscribed_at)):
+        day = func.date(column)
+        conn.execute(insert(daily).from_select(
+            ["metric", "day", "value"],
+            select(literal(metric), day, func.count()).where(column.isnot(None)).group_by(day)
+        ))
+
+
+async def get_timeseries(db: AsyncSession, metric: str, start: date, end: date) -> List[dict]:
+    """Daily values of a metric from start to end included, 0 for days without data"""
+    rows = await db.execute(select(DailyStat.day, DailyStat.value).where(
+        DailyStat.metric == metric, DailyStat.day.between(start, end)
+    ))
+    values: Dict[date, int] = dict(rows.all())
+    return [{"date": (start + timedelta(days=i)).isoformat(), "value": values.get(start + timedelta(days=i), 0)}
+            for i in range((end - start).days + 1)]
+
+
+def _subscribed(mapper, conn, target):
+    if target.is_active is not False:
+        add_daily(conn, "subscribers")
+
+
+def _resubscribed(mapper, conn, target):
+    if target.is_active and inspect(target).attrs.is_active.history.deleted == [False]:
+        add_daily(conn, "subscribers")
+
+
+event.listen(Spot, "after_insert", lambda mapper, conn, target: add_daily(conn, "spots"))
+event.listen(Comment, "after_insert", lambda mapper, conn, target: add_daily(conn, "comments"))
+event.listen(Newsletter, "after_insert", _subscribed)
+event.listen(Newsletter, "after_update", _resubscribed)
+
+
+class _NotLoaded(Exception):
+    pass
+
+
+def _recent(value: Optional[datetime]) -> bool:
+    """Within the last month (None: server default, i.e. now)"""
+    if value is None:
+        return True
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value >= datetime.utcnow() - timedelta(days=30)
+
+
+def _contribution(obj, value: Callable[[str], object]) -> Counter:
+    """What a row adds to the counters, from its column values"""
+    if isinstance(obj, Article):
+        return Counter(total_views=value("views") or 0)
+    if isinstance(obj, Spot):
+        return Counter(total_spots=1, spots_last_month=_recent(value("created_at")))
+    if isinstance(obj, Newsletter):
+        active = value("is_active") is not False
+        return Counter(total_subscribers=active, subs_last_month=active and _recent(value("subscribed_at")))
+    return Counter(pending_comments=value("is_approved") is not True)
+
+
+def _values(obj, new: bool = False, old: bool = False) -> Callable[[str], object]:
+    """Column values of a flushed row, before the flush if old, from its attribute history"""
+    state = inspect(obj)
+    def value(name):
+        added, unchanged, deleted = state.attrs[name].history
+        if unchanged:
+            return unchanged[0]
+        if added:
+            return (deleted[0] if deleted else None) if old else added[0]
+        if new:
+            return None
+        raise _NotLoaded(name)
+    return value
+
+
+def _deltas(session) -> Counter:
+    deltas = Counter()
+    for obj in session.new:
+        if type(obj) in COUNTED:
+            deltas.update(_contribution(obj, _values(obj, new=True)))
+    for obj in session.deleted:
+        if type(obj) in COUNTED:
+            deltas.subtract(_contribution(obj, _values(obj)))
+    for obj in session.dirty:
+        columns = COUNTED.get(type(obj), ())
+        if any(inspect(obj).attrs[name].history.has_changes() for name in columns):
+            deltas.update(_contribution(obj, _values(obj)))
+            deltas.subtract(_contribution(obj, _values(obj, old=True)))
+    return deltas
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_counted(session, flush_context):
+    if session.info.get("stats_stale"):
+        return
+    try:
+        session.info.setdefault("stats_deltas", Counter()).update(_deltas(session))
+    except _NotLoaded:
+        session.info["stats_stale"] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _bulk_counted(orm_execute_state):
+    statement = orm_execute_state.statement
+    if statement.is_dml and statement.table.name in COUNTED_TABLES:
+        orm_execute_state.session.info["stats_stale"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_committed(session):
+    deltas = session.info.pop("stats_deltas", None)
+    if session.info.pop("stats_stale", False):
+        stats_snapshot.invalidate()
+    elif deltas:
+        stats_snapshot.add(**deltas)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session):
+    session.info.pop("stats_deltas", None)
+    session.info.pop("stats_stale", None)
@@ -0,0 +1,97 @@
+"""
+In-memory cache of authenticated users
+
+Tokens carry the user id and token version, so most authenticated requests
+resolve their user from this cache without touching the database. Committed
+changes to a user drop its entries; changing the claims of a user (admin role)
+also bumps User.token_version, which makes its existing tokens invalid.
+
+With the shared cache backend (CACHE_BACKEND=shared), invalidations also bump a
+per-user counter in its store, checked on every hit, so all processes see them
+at once. Otherwise other processes only see a change when their entry expires:
+a deleted user or a revoked admin role keeps working there for up to
+USER_CACHE_TTL (10 s by default).
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Optional
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.cache import KeyValueStore, SharedCache, response_cache
+from app.models import User
+
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "10"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "1000"))
+
+
+class UserCache:
+    """LRU cache with TTL of detached users, keyed by (id, token version), checked
+    against the invalidation counters of a shared store if there is one"""
+
+    def __init__(self, max_entries: int = USER_CACHE_MAX_ENTRIES, ttl: float = USER_CACHE_TTL,
+                 store: Optional[KeyValueStore] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.store = store
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()  # (id, version) -> (expires_at, user, stamp)
+        self._lock = threading.Lock()
+
+    def stamp(self, user_id: int) -> Optional[bytes]:
+        """Invalidation counter of a user in the shared store (None without one), read before loading the user"""
+        return self.store.get(f"user:{user_id}") if self.store is not None else None
+
+    def get(self, user_id: int, version: int) -> Optional[User]:
+        stamp = self.stamp(user_id)
+        with self._lock:
+            entry = self._entries.get((user_id, version))
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic() or entry[2] != stamp:
+                del self._entries[(user_id, version)]
+                return None
+            self._entries.move_to_end((user_id, version))
+            return entry[1]
+
+    def set(self, user: User, stamp: Optional[bytes] = None) -> None:
+        with self._lock:
+            self._entries[(user.id, user.token_version)] = (time.monotonic() + self.ttl, user, stamp)
+            self._entries.move_to_end((user.id, user.token_version))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *user_ids: int) -> None:
+        """Drop every cached version of some users, in all processes sharing the store"""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] in user_ids]:
+                del self._entries[key]
+        if self.store is not None:
+            for user_id in user_ids:
+                self.store.incr(f"user:{user_id}")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache(store=response_cache.store if isinstance(response_cache, SharedCache) else None)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_users(session, flush_context):
+    ids = session.info.setdefault("changed_users", set())
+    ids.update(obj.id for obj in list(session.dirty) + list(session.deleted) if isinstance(obj, User))
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session):
+    ids = session.info.pop("changed_users", None)
+    if ids:
+        user_cache.invalidate(*ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session):
+    session.info.pop("changed_users", None)
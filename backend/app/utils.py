@@ -1,37 +1,42 @@
 """
 Utility functions to reduce code duplication
 """
-from sqlalchemy.orm import Session
-from sqlalchemy import Column
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.engine import Connection
+from sqlalchemy.sql import Select
+from sqlalchemy import DateTime, Table, select, and_, or_, func
+from sqlalchemy.dialects import postgresql, sqlite
 from fastapi import HTTPException
-from typing import Type, TypeVar, Optional, Dict, Any
+from typing import Type, TypeVar, Optional, Dict, Any, List, Tuple
 from datetime import datetime
+import base64
+import json
 
 ModelType = TypeVar("ModelType")
 
 
-def get_or_404(db: Session, model: Type[ModelType], item_id: int) -> ModelType:
-    """Get an item by ID or raise 404"""
-    item = db.query(model).filter(model.id == item_id).first()
+async def get_or_404(db: AsyncSession, model: Type[ModelType], item_id: int, *options) -> ModelType:
+    """Get an item by ID or raise 404 (options: loader options such as joinedload)"""
+    item = await db.get(model, item_id, options=options or None)
     if not item:
         raise HTTPException(status_code=404, detail=f"{model.__name__} not found")
     return item
 
 
-def update_model(db: Session, model_instance: ModelType, update_data: Dict[str, Any]) -> ModelType:
+async def update_model(db: AsyncSession, model_instance: ModelType, update_data: Dict[str, Any]) -> ModelType:
     """Update model instance with provided data"""
     for field, value in update_data.items():
         setattr(model_instance, field, value)
-    db.commit()
-    db.refresh(model_instance)
+    await db.commit()
+    await db.refresh(model_instance)
     return model_instance
 
 
-def delete_model(db: Session, model_instance: ModelType) -> Dict[str, str]:
+async def delete_model(db: AsyncSession, model_instance: ModelType) -> Dict[str, str]:
     """Delete a model instance"""
     model_name = model_instance.__class__.__name__
-    db.delete(model_instance)
-    db.commit()
+    await db.delete(model_instance)
+    await db.commit()
     return {"message": f"{model_name} deleted successfully"}
 
 
@@ -41,17 +46,64 @@ def create_slug(text: str) -> str:
     return "".join(c for c in slug if c.isalnum() or c == "-")
 
 
-def ensure_unique_slug(db: Session, model: Type[ModelType], slug: str, exclude_id: Optional[int] = None) -> str:
+async def ensure_unique_slug(db: AsyncSession, model: Type[ModelType], slug: str, exclude_id: Optional[int] = None) -> str:
     """Ensure slug is unique, append timestamp if needed"""
-    query = db.query(model).filter(model.slug == slug)
+    query = select(model.id).where(model.slug == slug)
     if exclude_id:
-        query = query.filter(model.id != exclude_id)
-    if query.first():
+        query = query.where(model.id != exclude_id)
+    if (await db.execute(query.limit(1))).first():
         slug = f"{slug}-{int(datetime.now().timestamp())}"
     return slug
 
 
-def add_author_name(article_dict: Dict, author) -> Dict:
-    """Add author_name to article dictionary"""
-    article_dict["author_name"] = author.full_name or author.username if author else None
-    return article_dict
+def encode_cursor(value: Any, item_id: int) -> str:
+    """Build an opaque pagination cursor from a sort value and an id"""
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    elif hasattr(value, "value"):
+        value = value.value
+    raw = json.dumps([value, item_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_column) -> Tuple[Any, int]:
+    """Decode a cursor built by encode_cursor, raise 400 if malformed"""
+    try:
+        value, item_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if value is not None and isinstance(sort_column.type, DateTime):
+            value = datetime.fromisoformat(value)
+        return value, int(item_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def keyset_page(db: AsyncSession, query: Select, sort_column, id_column, cursor: Optional[str], limit: int) -> Tuple[List, Optional[str]]:
+    """Return one page ordered by (sort_column DESC NULLS LAST, id DESC) and the cursor of the next page.
+
+    An empty cursor means the first page. The reference row is compared through a
+    primary key lookup so values are matched in the database's own representation."""
+    if cursor:
+        value, last_id = decode_cursor(cursor, sort_column)
+        if value is None:
+            query = query.where(sort_column.is_(None), id_column < last_id)
+        else:
+            ref = func.coalesce(select(sort_column).where(id_column == last_id).correlate(None).scalar_subquery(), value)
+            query = query.where(or_(sort_column < ref, and_(sort_column == ref, id_column < last_id), sort_column.is_(None)))
+    items = (await db.execute(query.order_by(sort_column.desc().nulls_last(), id_column.desc()).limit(limit + 1))).scalars().all()
+    if len(items) <= limit:
+        return items, None
+    last = items[limit - 1]
+    return items[:limit], encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key))
+
+
+# INSERT constructs supporting ON CONFLICT DO UPDATE
+UPSERT_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def upsert_add(conn: Connection, table: Table, key: Dict[str, Any], values: Dict[str, Any]) -> None:
+    """Insert a row, or add values to its columns if its key exists, in one atomic statement
+    (INSERT ... ON CONFLICT DO UPDATE: concurrent writers cannot both insert)"""
+    statement = UPSERT_INSERTS[conn.dialect.name](table).values(**key, **values)
+    conn.execute(statement.on_conflict_do_update(
+        index_elements=list(key), set_={name: table.c[name] + statement.excluded[name] for name in values}
+    ))
@@ -0,0 +1,104 @@
+"""
+Write-behind article view counter
+"""
+import os
+import asyncio
+import logging
+import threading
+from typing import Dict, Iterable, Optional
+from sqlalchemy import update, bindparam
+from starlette.concurrency import run_in_threadpool
+
+from app.database import SessionLocal
+from app.models import Article
+from app.cache import response_cache
+from app.stats import stats_snapshot, add_daily
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two flushes of pending views to the database
+VIEWS_FLUSH_INTERVAL = float(os.getenv("VIEWS_FLUSH_INTERVAL", "10"))
+
+
+class ViewCounter:
+    """Accumulate article views in memory and persist them in batches"""
+
+    def __init__(self):
+        self._pending: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def increment(self, article_id: int, n: int = 1) -> None:
+        """Record n views for an article"""
+        with self._lock:
+            self._pending[article_id] = self._pending.get(article_id, 0) + n
+
+    def pending(self, article_id: int) -> int:
+        """Views recorded but not yet flushed for an article"""
+        return self._pending.get(article_id, 0)
+
+    def pending_total(self, article_ids: Optional[Iterable[int]] = None) -> int:
+        """Sum of pending views, optionally restricted to some articles"""
+        with self._lock:
+            if article_ids is None:
+                return sum(self._pending.values())
+            return sum(self._pending.get(i, 0) for i in article_ids)
+
+    def pending_ids(self) -> list:
+        """IDs of articles with pending views"""
+        with self._lock:
+            return list(self._pending)
+
+    def discard(self, article_id: int) -> None:
+        """Forget pending views (e.g. the article was deleted)"""
+        with self._lock:
+            self._pending.pop(article_id, None)
+
+    def clear(self) -> None:
+        """Forget all pending views"""
+        with self._lock:
+            self._pending.clear()
+
+    def flush(self) -> int:
+        """Persist pending views with one bulk UPDATE, return number of views written"""
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return 0
+        # updated_at and version are passed through unchanged: a page view is not an edit
+        articles = Article.__table__
+        stmt = (
+            update(articles)
+            .where(articles.c.id == bindparam("article_id"))
+            .values(views=articles.c.views + bindparam("n"), updated_at=articles.c.updated_at, version=articles.c.version)
+        )
+        total = sum(batch.values())
+        db = SessionLocal()
+        try:
+            # On the connection: the session would mark the stats snapshot stale for a bulk UPDATE
+            conn = db.connection()
+            conn.execute(stmt, [{"article_id": k, "n": v} for k, v in batch.items()])
+            add_daily(conn, "views", total)
+            db.commit()
+        except Exception:
+            db.rollback()
+            for article_id, n in batch.items():
+                self.increment(article_id, n)
+            raise
+        finally:
+            db.close()
+        # Cached article details carry the persisted count, lists may lag by up to CACHE_TTL
+        response_cache.invalidate(*(f"article:{i}" for i in batch))
+        stats_snapshot.add(total_views=total, views_last_month=total)
+        return total
+
+    async def run(self, interval: float = VIEWS_FLUSH_INTERVAL) -> None:
+        """Flush periodically until cancelled"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await run_in_threadpool(self.flush)
+            except Exception:
+                logger.exception("View counter flush failed")
+
+
+view_counter = ViewCounter()
@@ -1,13 +1,14 @@
 """
 Script d'initialisation de la base de données avec des données de démo
 """
-from app.database import SessionLocal, engine, Base
+from app.database import SessionLocal
+from app.migrations import run_migrations
 from app.models import User, Article, Spot, Newsletter, ArticleStatus, SpotCategory
 from app.routers.auth import get_password_hash
 from datetime import datetime
 
-# Create all tables
-Base.metadata.create_all(bind=engine)
+# Create tables and apply migrations
+run_migrations()
 
 db = SessionLocal()
 
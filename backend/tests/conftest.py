@@ -0,0 +1,70 @@
+"""
+Test settings: a throwaway SQLite database and page cache, set before the app is imported
+"""
+import os
+import sys
+import tempfile
+
+TEST_DIR = tempfile.mkdtemp(prefix="lumiere-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(TEST_DIR, 'test.db')}")
+os.environ.setdefault("RENDER_CACHE_DIR", os.path.join(TEST_DIR, "pages"))
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import re
+import pytest
+from sqlalchemy import text
+
+QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    from app.main import app
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def db(client):
+    """Session on emptied tables and caches"""
+    from app.database import Base, SessionLocal, engine
+    from app.cache import response_cache
+    from app.user_cache import user_cache
+    from app.stats import stats_snapshot
+    from app.views import view_counter
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+        conn.execute(text("DELETE FROM search_index"))
+        conn.execute(text("DELETE FROM spots_rtree"))
+    response_cache.clear()
+    user_cache.clear()
+    stats_snapshot.invalidate()
+    view_counter.clear()
+    with SessionLocal() as session:
+        yield session
+
+
+@pytest.fixture
+def admin_headers(client, db):
+    from app.models import User
+    from app.routers.auth import create_access_token
+    admin = User(username="admin", email="admin@example.com", hashed_password="-", full_name="Admin", is_admin=True)
+    db.add(admin)
+    db.commit()
+    token = create_access_token({"sub": admin.username, "uid": admin.id, "adm": True, "ver": admin.token_version})
+    headers = {"Authorization": f"Bearer {token}"}
+    client.get("/api/auth/me", headers=headers)  # loads the user cache, like any session after its first request
+    return headers
+
+
+def query_count(client, url: str, **kwargs) -> int:
+    """Statements run by a request (from its Server-Timing header), response cache emptied first"""
+    from app.cache import response_cache
+    response_cache.clear()
+    response = client.get(url, **kwargs)
+    assert response.status_code == 200, response.text
+    return int(QUERIES.search(response.headers["server-timing"]).group(1))
@@ -0,0 +1,103 @@
+"""
+Admin bulk deletes: exact counts, cascades to replies and comments, filter
+selections, and at most BULK_CHUNK_SIZE bound parameters per statement
+"""
+import pytest
+from sqlalchemy import event, func, select
+
+from app.models import Article, ArticleStatus, Comment, User
+from app.routers.admin import BULK_CHUNK_SIZE
+
+ROOTS = BULK_CHUNK_SIZE + 100  # more than one chunk
+
+
+@pytest.fixture
+def max_parameters():
+    """Largest number of parameters bound to one statement while the test runs"""
+    from app.database import async_engine
+    seen = [0]
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany:
+            seen[0] = max(seen[0], len(parameters))
+    event.listen(async_engine.sync_engine, "before_cursor_execute", capture)
+    yield seen
+    event.remove(async_engine.sync_engine, "before_cursor_execute", capture)
+
+
+def add_thread_comments(db, author: User, n: int, approved_every: int = 0) -> tuple:
+    """n root comments on a new article, the first ten with a reply; returns (article, roots, replies)"""
+    article = Article(title=f"A{author.id}", slug=f"a{author.id}", content="...", status=ArticleStatus.PUBLISHED, author=author)
+    roots = [Comment(content="...", article=article, author=author, is_approved=bool(approved_every) and i % approved_every == 0)
+             for i in range(n)]
+    db.add_all(roots)
+    db.flush()
+    replies = [Comment(content="...", article=article, author=author, parent_id=root.id) for root in roots[:10]]
+    db.add_all(replies)
+    db.commit()
+    return article, roots, replies
+
+
+def add_user(db, name: str) -> User:
+    user = User(username=name, email=f"{name}@example.com", hashed_password="-")
+    db.add(user)
+    db.commit()
+    return user
+
+
+def comment_count(db) -> int:
+    return db.scalar(select(func.count(Comment.id)))
+
+
+def test_comments_with_replies(client, db, admin_headers, max_parameters):
+    _, roots, replies = add_thread_comments(db, add_user(db, "author"), ROOTS)
+    # A reply selected with its parent is counted once
+    ids = [c.id for c in roots] + [replies[0].id]
+    body = client.post("/api/admin/comments/bulk-delete", json=ids, headers=admin_headers).json()
+    assert body["deleted_count"] == ROOTS + len(replies)
+    assert comment_count(db) == 0
+    assert max_parameters[0] <= BULK_CHUNK_SIZE
+
+
+def test_comments_filter_selection(client, db, admin_headers):
+    add_thread_comments(db, add_user(db, "author"), 30, approved_every=3)
+    pending = db.scalar(select(func.count(Comment.id)).where(Comment.is_approved == False))
+    body = client.post("/api/admin/comments/bulk-delete", json={"is_approved": False}, headers=admin_headers).json()
+    assert body["deleted_count"] == pending
+    assert comment_count(db) == 10
+    assert client.post("/api/admin/comments/bulk-delete", json={}, headers=admin_headers).status_code == 400
+
+
+def test_users_with_their_comments(client, db, admin_headers, max_parameters):
+    author = add_user(db, "author")
+    article, roots, _ = add_thread_comments(db, author, 10)
+    users = [User(username=f"u{i}", email=f"u{i}@example.com", hashed_password="-") for i in range(ROOTS)]
+    db.add_all(users)
+    db.flush()
+    # Each of the first ten users comments once, and the author replies to them
+    comments = [Comment(content="...", article=article, author=user) for user in users[:10]]
+    db.add_all(comments)
+    db.flush()
+    db.add_all(Comment(content="...", article=article, author=author, parent_id=c.id) for c in comments)
+    db.commit()
+    before = comment_count(db)
+    body = client.post("/api/admin/users/bulk-delete", json=[u.id for u in users] + [author.id],
+                       headers=admin_headers).json()
+    assert (body["deleted_count"], body["skipped_count"], body["deleted_comments"]) == (ROOTS, 1, 20)
+    assert comment_count(db) == before - 20
+    assert max_parameters[0] <= BULK_CHUNK_SIZE
+
+
+def test_articles_with_their_comments(client, db, admin_headers, max_parameters):
+    author = add_user(db, "author")
+    kept, _, _ = add_thread_comments(db, add_user(db, "other"), 5)
+    articles = [Article(title=f"T{i}", slug=f"t{i}", content="...", status=ArticleStatus.DRAFT, author=author)
+                for i in range(ROOTS)]
+    db.add_all(articles)
+    db.flush()
+    db.add_all(Comment(content="...", article=a, author=author) for a in articles[:10])
+    db.commit()
+    body = client.post("/api/admin/articles/bulk-delete", json={"status": "draft"}, headers=admin_headers).json()
+    assert (body["deleted_count"], body["deleted_comments"]) == (ROOTS, 10)
+    assert db.scalars(select(Article.id)).all() == [kept.id]
+    assert comment_count(db) == 10
+    assert max_parameters[0] <= BULK_CHUNK_SIZE
@@ -0,0 +1,66 @@
+"""
+Response cache invalidation: ORM writes and bulk statements, including those
+committed while an entry is being built
+"""
+import pytest
+from sqlalchemy import update
+
+from app import cache
+from app.cache import MemoryCache, SharedCache, LocalStore, get_or_build
+from app.models import Article, ArticleStatus, User
+
+KEY = "articles?"
+
+
+def add_article(db, title: str) -> Article:
+    author = User(username="author", email="author@example.com", hashed_password="-")
+    article = Article(title=title, slug=title.lower(), content="...", status=ArticleStatus.PUBLISHED, author=author)
+    db.add(article)
+    db.commit()
+    return article
+
+
+def titles(client) -> list:
+    return [a["title"] for a in client.get("/api/articles/").json()]
+
+
+def orm_write(db, article):
+    article.title = "After"
+    db.commit()
+
+
+def bulk_write(db, article):
+    db.execute(update(Article).where(Article.id == article.id).values(title="After"))
+    db.commit()
+    cache.response_cache.invalidate("articles")  # as the bulk endpoints do
+
+
+@pytest.mark.parametrize("backend", [MemoryCache, lambda: SharedCache(LocalStore())])
+@pytest.mark.parametrize("write", [orm_write, bulk_write])
+def test_write_during_build_is_not_stored(client, db, monkeypatch, backend, write):
+    monkeypatch.setattr(cache, "response_cache", backend())
+    article = add_article(db, "Before")
+    async def build():
+        title = db.get(Article, article.id).title
+        write(db, article)  # committed while the entry is built
+        return [title]
+    assert client.portal.call(get_or_build, KEY, ["articles"], build) == b'["Before"]'
+    assert cache.response_cache.get(KEY) is None
+    async def rebuild():
+        return [db.get(Article, article.id).title]
+    assert client.portal.call(get_or_build, KEY, ["articles"], rebuild) == b'["After"]'
+    assert cache.response_cache.get(KEY) == b'["After"]'
+
+
+def test_orm_write_invalidates(client, db, admin_headers):
+    article = add_article(db, "Before")
+    assert titles(client) == ["Before"]
+    assert client.put(f"/api/articles/{article.id}", json={"title": "After"}, headers=admin_headers).status_code == 200
+    assert titles(client) == ["After"]
+
+
+def test_bulk_delete_invalidates(client, db, admin_headers):
+    article = add_article(db, "Before")
+    assert titles(client) == ["Before"]
+    client.post("/api/admin/articles/bulk-delete", json=[article.id], headers=admin_headers)
+    assert titles(client) == []
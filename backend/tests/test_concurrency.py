@@ -0,0 +1,52 @@
+"""
+Throughput of /api/articles/ while a slow query runs, with the query blocking the
+event loop (synchronous session, as handlers did before the async engine) or
+awaited on the async engine
+"""
+import os
+import time
+import asyncio
+
+import httpx
+from sqlalchemy import text
+
+from app.main import app
+from app.database import engine, async_engine
+from test_queries import add_users, add_articles
+
+BENCH_REQUESTS = int(os.getenv("BENCH_REQUESTS", "50"))
+SLOW_QUERY = text("WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n WHERE x < :n) SELECT count(*) FROM n")
+SLOW_ROWS = int(os.getenv("BENCH_SLOW_ROWS", "4000000"))
+
+
+async def slow_sync_query():
+    with engine.connect() as conn:
+        conn.execute(SLOW_QUERY, {"n": SLOW_ROWS}).scalar()
+
+
+async def slow_async_query():
+    async with async_engine.connect() as conn:
+        (await conn.execute(SLOW_QUERY, {"n": SLOW_ROWS})).scalar()
+
+
+async def throughput(slow_query) -> float:
+    """Requests per second served while slow_query runs"""
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        async def load():
+            # Keyset pages are not cached: each request queries the database
+            responses = await asyncio.gather(*(client.get("/api/articles/?cursor=&limit=20") for _ in range(BENCH_REQUESTS)))
+            assert all(r.status_code == 200 for r in responses)
+            return time.perf_counter()
+        start = time.perf_counter()
+        _, done = await asyncio.gather(slow_query(), load())
+    return BENCH_REQUESTS / (done - start)
+
+
+def test_throughput_during_slow_query(client, db):
+    add_articles(db, 0, 50, add_users(db, 0, 5))
+    # On the event loop of the app (the async engine pool is bound to it)
+    before = client.portal.call(throughput, slow_sync_query)
+    after = client.portal.call(throughput, slow_async_query)
+    print(f"\n/api/articles/ during a slow query: {before:.0f} req/s blocking, {after:.0f} req/s async")
+    assert after > 2 * before
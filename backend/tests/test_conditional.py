@@ -0,0 +1,32 @@
+"""
+Conditional requests: a 304 only while the client copy is current
+"""
+
+
+def test_spot_edits_within_a_second(client, admin_headers):
+    spot = client.post("/api/spots/", json={"name": "S0", "location": "Lyon", "latitude": 45.76, "longitude": 4.83},
+                       headers=admin_headers).json()
+    url = f"/api/spots/{spot['id']}"
+    client.put(url, json={"name": "S1"}, headers=admin_headers)
+    etag = client.get(url).headers["etag"]
+    client.put(url, json={"name": "S2"}, headers=admin_headers)
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200 and response.json()["name"] == "S2"
+    assert client.get(url, headers={"If-None-Match": response.headers["etag"]}).status_code == 304
+
+
+def test_article_edits_within_a_second(client, admin_headers):
+    article = client.post("/api/articles/", json={"title": "A0", "content": "...", "status": "published"},
+                          headers=admin_headers).json()
+    url = f"/api/articles/{article['id']}"
+    etag = client.get(url).headers["etag"]
+    client.put(url, json={"title": "A1"}, headers=admin_headers)
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200 and response.json()["title"] == "A1"
+
+
+def test_list_revalidation(client, admin_headers):
+    etag = client.get("/api/spots/").headers["etag"]
+    assert client.get("/api/spots/", headers={"If-None-Match": etag}).status_code == 304
+    client.post("/api/spots/", json={"name": "S", "location": "Lyon", "latitude": 45.76, "longitude": 4.83}, headers=admin_headers)
+    assert client.get("/api/spots/", headers={"If-None-Match": etag}).status_code == 200
@@ -0,0 +1,120 @@
+"""
+Upgrade of a database created with the first schema, before any migration,
+and plans of the statements the listing endpoints run on it
+"""
+import pytest
+from sqlalchemy import create_engine, event, inspect, text
+
+from app.migrations import MIGRATIONS, run_migrations
+
+BASELINE_SCHEMA = """
+CREATE TABLE users (
+    id INTEGER NOT NULL PRIMARY KEY, username VARCHAR NOT NULL, email VARCHAR NOT NULL,
+    hashed_password VARCHAR NOT NULL, full_name VARCHAR, is_admin BOOLEAN,
+    created_at DATETIME DEFAULT (CURRENT_TIMESTAMP)
+);
+CREATE INDEX ix_users_id ON users (id);
+CREATE UNIQUE INDEX ix_users_username ON users (username);
+CREATE UNIQUE INDEX ix_users_email ON users (email);
+CREATE TABLE articles (
+    id INTEGER NOT NULL PRIMARY KEY, title VARCHAR NOT NULL, slug VARCHAR NOT NULL, excerpt TEXT,
+    content TEXT NOT NULL, cover_image VARCHAR, category VARCHAR, status VARCHAR(9), reading_time INTEGER,
+    author_id INTEGER NOT NULL REFERENCES users (id), published_at DATETIME,
+    created_at DATETIME DEFAULT (CURRENT_TIMESTAMP), updated_at DATETIME, views INTEGER
+);
+CREATE INDEX ix_articles_title ON articles (title);
+CREATE UNIQUE INDEX ix_articles_slug ON articles (slug);
+CREATE INDEX ix_articles_id ON articles (id);
+CREATE TABLE spots (
+    id INTEGER NOT NULL PRIMARY KEY, name VARCHAR NOT NULL, description TEXT, location VARCHAR NOT NULL,
+    latitude FLOAT NOT NULL, longitude FLOAT NOT NULL, category VARCHAR(9), image_url VARCHAR, rating FLOAT,
+    tags VARCHAR, best_time VARCHAR, equipment_needed VARCHAR,
+    created_at DATETIME DEFAULT (CURRENT_TIMESTAMP), updated_at DATETIME
+);
+CREATE INDEX ix_spots_id ON spots (id);
+CREATE INDEX ix_spots_name ON spots (name);
+CREATE TABLE comments (
+    id INTEGER NOT NULL PRIMARY KEY, content TEXT NOT NULL,
+    article_id INTEGER NOT NULL REFERENCES articles (id), author_id INTEGER NOT NULL REFERENCES users (id),
+    created_at DATETIME DEFAULT (CURRENT_TIMESTAMP), updated_at DATETIME, is_approved BOOLEAN
+);
+CREATE INDEX ix_comments_id ON comments (id);
+CREATE TABLE newsletter (
+    id INTEGER NOT NULL PRIMARY KEY, email VARCHAR NOT NULL,
+    subscribed_at DATETIME DEFAULT (CURRENT_TIMESTAMP), is_active BOOLEAN
+);
+CREATE INDEX ix_newsletter_id ON newsletter (id);
+CREATE UNIQUE INDEX ix_newsletter_email ON newsletter (email);
+"""
+
+# Listing endpoints -> indexes the statements they run must use
+LIST_ENDPOINTS = {
+    "/api/articles/": ["ix_articles_status_published_at"],
+    "/api/articles/?cursor=": ["ix_articles_status_published_at"],
+    "/api/articles/?category=Paysage&cursor=": ["ix_articles_category_status_published_at"],
+    "/api/admin/articles?cursor=&with_total=false": ["ix_articles_created_at"],
+    "/api/admin/users?cursor=": ["ix_users_created_at", "ix_articles_author_id"],
+    "/api/spots/?cursor=": ["ix_spots_rating"],
+    "/api/spots/?category=nature&cursor=": ["ix_spots_category_rating"],
+    "/api/admin/comments?is_approved=false": ["ix_comments_is_approved_created_at"],
+    "/api/articles/{article_id}/comments": ["ix_comments_article_id_is_approved_created_at", "ix_comments_parent_id"],
+    "/api/admin/stats": ["ix_newsletter_is_active_subscribed_at"],
+}
+
+
+@pytest.fixture
+def baseline_engine(tmp_path):
+    bind = create_engine(f"sqlite:///{tmp_path / 'baseline.db'}")
+    with bind.begin() as conn:
+        for statement in BASELINE_SCHEMA.split(";"):
+            if statement.strip():
+                conn.execute(text(statement))
+    yield bind
+    bind.dispose()
+
+
+def test_upgrade_from_baseline(baseline_engine):
+    assert run_migrations(bind=baseline_engine) == len(MIGRATIONS)
+    assert {"parent_id"} <= {c["name"] for c in inspect(baseline_engine).get_columns("comments")}
+    assert {"token_version"} <= {c["name"] for c in inspect(baseline_engine).get_columns("users")}
+    with baseline_engine.connect() as conn:
+        assert conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() == len(MIGRATIONS)
+
+
+def test_upgrade_is_idempotent(baseline_engine):
+    run_migrations(bind=baseline_engine)
+    assert run_migrations(bind=baseline_engine) == len(MIGRATIONS)
+
+
+def endpoint_statements(client, url: str, headers: dict) -> list:
+    """SELECT statements (with their parameters) run by a request"""
+    from app.database import async_engine
+    statements = []
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+    event.listen(async_engine.sync_engine, "before_cursor_execute", capture)
+    try:
+        response = client.get(url, headers=headers)
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", capture)
+    assert response.status_code == 200, response.text
+    return statements
+
+
+@pytest.mark.parametrize("url, indexes", LIST_ENDPOINTS.items())
+def test_list_queries_use_indexes(baseline_engine, client, db, admin_headers, url, indexes):
+    from app.models import Article, ArticleStatus, Comment
+    article = Article(title="A", slug="a", content="...", status=ArticleStatus.PUBLISHED, author_id=1)
+    db.add(article)
+    db.flush()
+    db.add(Comment(content="...", article_id=article.id, author_id=1, is_approved=True))  # so that replies are fetched
+    db.commit()
+    statements = endpoint_statements(client, url.format(article_id=article.id), admin_headers)
+    run_migrations(bind=baseline_engine)
+    with baseline_engine.connect() as conn:
+        plan = " | ".join(row[-1] for statement, parameters in statements
+                          for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters))
+    for index in indexes:
+        assert f"INDEX {index}" in plan, plan
+    assert "TEMP B-TREE" not in plan, plan
@@ -0,0 +1,15 @@
+"""
+Server-side rendered pages follow the edits of their articles
+"""
+
+
+def test_article_page_after_edit(client, admin_headers):
+    article = client.post("/api/articles/", json={"title": "T1", "content": "..."}, headers=admin_headers).json()
+    url = f"/api/articles/{article['id']}"
+    client.put(url, json={"status": "published"}, headers=admin_headers)
+    assert "T1 | LUMIÈRE" in client.get(f"/articles/{article['slug']}").text
+    client.put(url, json={"title": "T2"}, headers=admin_headers)
+    page = client.get(f"/articles/{article['slug']}").text
+    assert "T2 | LUMIÈRE" in page and "T1" not in page
+    client.put(url, json={"title": "T3"}, headers=admin_headers)
+    assert "T3" in client.get("/").text
@@ -0,0 +1,47 @@
+"""
+Number of statements of the list endpoints, which must not grow with the rows listed
+"""
+from datetime import datetime, timedelta
+
+from app.models import Article, ArticleStatus, User
+from conftest import query_count
+
+
+def add_users(db, start: int, n: int):
+    users = [User(username=f"user{i}", email=f"user{i}@example.com", hashed_password="-") for i in range(start, start + n)]
+    db.add_all(users)
+    db.commit()
+    return users
+
+
+def add_articles(db, start: int, n: int, authors):
+    db.add_all(Article(
+        title=f"Article {i}", slug=f"article-{i}", content="...", status=ArticleStatus.PUBLISHED,
+        author_id=authors[i % len(authors)].id, published_at=datetime(2024, 1, 1) + timedelta(hours=i)
+    ) for i in range(start, start + n))
+    db.commit()
+
+
+def test_article_lists(client, db, admin_headers):
+    authors = add_users(db, 0, 10)
+    urls = ["/api/articles/?limit=100", "/api/articles/?limit=100&cursor=", "/api/admin/articles?limit=100"]
+    add_articles(db, 0, 1, authors)
+    one = [query_count(client, url, headers=admin_headers) for url in urls]
+    add_articles(db, 1, 99, authors)
+    hundred = [query_count(client, url, headers=admin_headers) for url in urls]
+    assert hundred == one
+    # Authors come with the articles, not from a query per row
+    assert all(a["author_name"] for a in client.get(urls[0]).json())
+    assert all(a["author"] != "Unknown" for a in client.get(urls[2], headers=admin_headers).json()["items"])
+
+
+def test_user_list(client, db, admin_headers):
+    urls = ["/api/admin/users?limit=100", "/api/admin/users?limit=100&cursor="]
+    one = [query_count(client, url, headers=admin_headers) for url in urls]
+    users = add_users(db, 0, 3000)
+    add_articles(db, 0, 300, users[:100])
+    thousands = [query_count(client, url, headers=admin_headers) for url in urls]
+    assert thousands == one
+    # Article counts come from the grouped join, not from a COUNT per user
+    counts = {u["username"]: u["articles_count"] for u in client.get(urls[0], headers=admin_headers).json()}
+    assert counts["admin"] == 0 and counts["user0"] == 3
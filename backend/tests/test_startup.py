@@ -0,0 +1,34 @@
+"""
+Cold start budget: import of the app and first request, in a fresh interpreter
+"""
+import os
+import sys
+import json
+import subprocess
+
+# Milliseconds; generous by default for slow CI machines, tighten it locally
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "5000"))
+
+COLD_START = """
+import sys, json, time
+start = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+lazy = sorted({m.split(".")[0] for m in sys.modules} & {"jose", "passlib"})
+from fastapi.testclient import TestClient
+with TestClient(app.main.app) as client:
+    status = client.get("/api/articles/").status_code
+print(json.dumps({"import_ms": (imported - start) * 1000, "total_ms": (time.perf_counter() - start) * 1000,
+                  "loaded_at_import": lazy, "status": status}))
+"""
+
+
+def test_cold_start(tmp_path):
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp_path / 'startup.db'}", RENDER_CACHE_DIR=str(tmp_path / "pages"))
+    out = subprocess.run([sys.executable, "-c", COLD_START], cwd=backend_dir, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    result = json.loads(out.strip().splitlines()[-1])
+    assert result["status"] == 200
+    assert result["loaded_at_import"] == [], "jose/passlib must only be imported on first authentication"
+    assert result["total_ms"] <= STARTUP_BUDGET_MS, result
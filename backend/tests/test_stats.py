@@ -0,0 +1,55 @@
+"""
+Dashboard counters: writes and view flushes add their deltas to the snapshot,
+bulk statements make it recompute
+"""
+from app import stats
+from app.views import view_counter
+
+COUNTERS = ("total_views", "total_spots", "total_subscribers", "pending_comments")
+
+
+def counters(client, headers) -> dict:
+    body = client.get("/api/admin/stats", headers=headers).json()
+    return {name: body[name] for name in COUNTERS}
+
+
+def published_article(client, headers) -> dict:
+    article = client.post("/api/articles/", json={"title": "A", "content": "..."}, headers=headers).json()
+    return client.put(f"/api/articles/{article['id']}", json={"status": "published"}, headers=headers).json()
+
+
+def test_deltas_without_recompute(client, admin_headers, monkeypatch):
+    computed = []
+    compute_stats = stats.compute_stats
+    async def counting(db):
+        computed.append(1)
+        return await compute_stats(db)
+    monkeypatch.setattr(stats, "compute_stats", counting)
+
+    article = published_article(client, admin_headers)
+    assert counters(client, admin_headers) == dict(total_views=0, total_spots=0, total_subscribers=0, pending_comments=0)
+
+    for _ in range(3):
+        client.get(f"/api/articles/{article['id']}")
+    view_counter.flush()
+    client.post("/api/spots/", json={"name": "S", "location": "Lyon", "latitude": 45.76, "longitude": 4.83}, headers=admin_headers)
+    client.post("/api/auth/newsletter/subscribe", json={"email": "a@example.com"})
+    first = client.post(f"/api/articles/{article['id']}/comments", json={"content": "1"}, headers=admin_headers).json()
+    client.post(f"/api/articles/{article['id']}/comments", json={"content": "2"}, headers=admin_headers)
+    client.post(f"/api/admin/comments/{first['id']}/approve", headers=admin_headers)
+    expected = dict(total_views=3, total_spots=1, total_subscribers=1, pending_comments=1)
+    assert counters(client, admin_headers) == expected
+    assert len(computed) == 1
+
+    stats.stats_snapshot.invalidate()
+    assert counters(client, admin_headers) == expected
+    assert len(computed) == 2
+
+
+def test_bulk_statements_recompute(client, admin_headers):
+    article = published_article(client, admin_headers)
+    for content in ("1", "2"):
+        client.post(f"/api/articles/{article['id']}/comments", json={"content": content}, headers=admin_headers)
+    assert counters(client, admin_headers)["pending_comments"] == 2
+    client.post("/api/admin/comments/bulk-approve", json={"is_approved": False}, headers=admin_headers)
+    assert counters(client, admin_headers)["pending_comments"] == 0
@@ -0,0 +1,35 @@
+"""
+User cache: invalidations reach every process sharing a store
+"""
+from app.cache import LocalStore
+from app.models import User
+from app.user_cache import UserCache
+
+
+def user(version: int = 0) -> User:
+    return User(id=1, username="u", email="u@example.com", hashed_password="-", token_version=version)
+
+
+def test_invalidation_reaches_other_processes():
+    store = LocalStore()
+    worker, other = UserCache(store=store), UserCache(store=store)
+    worker.set(user(), worker.stamp(1))
+    assert worker.get(1, 0) is not None
+    other.invalidate(1)
+    assert worker.get(1, 0) is None
+
+
+def test_invalidation_while_loading():
+    cache = UserCache(store=LocalStore())
+    stamp = cache.stamp(1)  # read before loading the user...
+    cache.invalidate(1)     # ...changed by another request meanwhile
+    cache.set(user(), stamp)
+    assert cache.get(1, 0) is None
+
+
+def test_without_store():
+    cache = UserCache()
+    cache.set(user())
+    assert cache.get(1, 0) is not None and cache.get(1, 1) is None
+    cache.invalidate(1)
+    assert cache.get(1, 0) is None
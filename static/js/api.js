@@ -87,6 +87,33 @@ class LumièreAPI {
         return this.request(`/spots${query ? '?' + query : ''}`);
     }
 
+    // Viewport as minLon,minLat,maxLon,maxLat
+    bboxParam(bounds) {
+        return [bounds.getWest(), bounds.getSouth(), bounds.getEast(), bounds.getNorth()]
+            .map(v => Math.max(-180, Math.min(180, v)).toFixed(5)).join(',');
+    }
+
+    // Compact map feed of a viewport, see _pack_map_feed in backend/app/routers/spots.py
+    async getSpotMap(bounds) {
+        const response = await fetch(`${API_BASE_URL}/spots/map?bbox=${this.bboxParam(bounds)}`);
+        if (!response.ok) throw new Error(`Erreur ${response.status}`);
+        const buffer = await response.arrayBuffer();
+        const n = new DataView(buffer).getUint32(0, true);
+        const ids = new Uint32Array(buffer, 4, n);
+        const lats = new Float32Array(buffer, 4 + 4 * n, n);
+        const lons = new Float32Array(buffer, 4 + 8 * n, n);
+        const categories = new Uint8Array(buffer, 4 + 12 * n, n);
+        const ratings = new Uint8Array(buffer, 4 + 13 * n, n);
+        const names = [null, 'nature', 'urban', 'portrait', 'landscape', 'street'];
+        return Array.from(ids, (id, i) => ({
+            id, latitude: lats[i], longitude: lons[i], category: names[categories[i]], rating: ratings[i] / 10
+        }));
+    }
+
+    async getSpotClusters(bounds, zoom) {
+        return this.request(`/spots/clusters?bbox=${this.bboxParam(bounds)}&zoom=${zoom}`);
+    }
+
     async getSpot(id) {
         return this.request(`/spots/${id}`);
     }
@@ -164,8 +191,18 @@ class LumièreAPI {
         return this.request('/admin/articles');
     }
 
-    async getComments() {
-        return this.request('/admin/comments');
+    async getComments(params = {}) {
+        const queryParams = new URLSearchParams();
+        if (params.is_approved !== undefined && params.is_approved !== null) queryParams.append('is_approved', params.is_approved);
+        if (params.cursor) queryParams.append('cursor', params.cursor);
+        if (params.limit) queryParams.append('limit', params.limit);
+
+        const query = queryParams.toString();
+        return this.request(`/admin/comments${query ? '?' + query : ''}`);
+    }
+
+    async getPendingCommentsCount() {
+        return this.request('/admin/comments/pending-count');
     }
 }
 
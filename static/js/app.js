@@ -23,6 +23,7 @@ function renderArticles() {
         const authorInitials = authorName.substring(0, 2).toUpperCase();
         return `
         <article class="group cursor-pointer">
+            <a href="/articles/${article.slug}">
             <div class="aspect-[4/3] w-full overflow-hidden rounded-xl bg-zinc-200 relative mb-4">
                 <img src="${article.cover_image || 'https://images.unsplash.com/photo-1493976040374-85c8e12f0c0e?ixlib=rb-4.0.3&auto=format&fit=crop&w=800&q=80'}" 
                      alt="${article.title}" 
@@ -40,6 +41,7 @@ function renderArticles() {
                 ${article.title}
             </h3>
             <p class="text-sm text-zinc-500 line-clamp-2">${article.excerpt || ''}</p>
+            </a>
         </article>
     `;
     }).join('');
@@ -93,14 +95,14 @@ function renderSpotsList() {
 function focusSpot(spotId) {
     const spot = spotsData.find(s => s.id === spotId);
     if (spot && map) {
+        // The markers of the new viewport are loaded after the move
+        map.once('moveend', () => mapRefresh.then(() => markers.find(m => m.spotId === spot.id)?.openPopup()));
         map.setView([spot.latitude, spot.longitude], 10);
-        const marker = markers.find(m => m._latlng.lat === spot.latitude && m._latlng.lng === spot.longitude);
-        if (marker) marker.openPopup();
     }
 }
 
 // Router
-const VIEWS = { 'home': 'view-home', 'spots': 'view-spots', 'admin': 'view-admin', 'guides': 'view-home' };
+const VIEWS = { 'home': 'view-home', 'article': 'view-article', 'spots': 'view-spots', 'admin': 'view-admin', 'guides': 'view-home' };
 
 function switchTab(tab) {
     Object.values(VIEWS).forEach(id => document.getElementById(id)?.classList.add('hidden'));
@@ -211,7 +213,8 @@ async function loadAdminStats() {
 
 // Initialize on DOM ready
 document.addEventListener('DOMContentLoaded', () => {
-    loadArticles();
+    // The server already rendered the cards of the homepage
+    if (!document.querySelector('#view-home .grid[data-rendered]')) loadArticles();
     const newsletterForm = document.querySelector('#view-home form');
     if (newsletterForm) {
         newsletterForm.addEventListener('submit', async (e) => {
@@ -2,12 +2,16 @@
  * Comments moderation functionality
  */
 let commentsData = [];
+let commentsCursor = null;
+let pendingCommentsCount = 0;
 
-async function loadComments() {
+async function loadComments(more = false) {
     try {
-        commentsData = await api.request('/admin/comments');
+        const page = await api.getComments({ is_approved: false, cursor: more ? commentsCursor : null });
+        commentsData = more ? commentsData.concat(page.items) : page.items;
+        commentsCursor = page.next_cursor;
+        await updateCommentsBadge();
         renderComments();
-        updateCommentsBadge();
     } catch (error) {
         console.error('Error loading comments:', error);
     }
@@ -16,14 +20,13 @@ async function loadComments() {
 function renderComments() {
     const container = document.getElementById('comments-container');
     if (!container) return;
-    const pending = commentsData.filter(c => !c.is_approved);
     container.innerHTML = `
         <div class="bg-white border border-zinc-200 rounded-xl shadow-sm overflow-hidden">
             <div class="px-6 py-4 border-b border-zinc-200 bg-zinc-50/30">
-                <h3 class="text-sm font-semibold text-zinc-900">Commentaires en attente (${pending.length})</h3>
+                <h3 class="text-sm font-semibold text-zinc-900">Commentaires en attente (${pendingCommentsCount})</h3>
             </div>
             <div class="divide-y divide-zinc-100">
-                ${pending.map(c => `
+                ${commentsData.map(c => `
                     <div class="p-4 hover:bg-zinc-50/50 transition">
                         <div class="flex items-start justify-between">
                             <div class="flex-1">
@@ -43,6 +46,11 @@ function renderComments() {
                     </div>
                 `).join('')}
             </div>
+            ${commentsCursor ? `
+                <div class="px-6 py-3 border-t border-zinc-200 text-center">
+                    <button onclick="loadComments(true)" class="text-xs font-medium text-zinc-600 hover:text-zinc-900">Charger plus</button>
+                </div>
+            ` : ''}
         </div>
     `;
 }
@@ -68,8 +76,8 @@ async function deleteComment(id) {
     }
 }
 
-function updateCommentsBadge() {
-    const pending = commentsData.filter(c => !c.is_approved).length;
+async function updateCommentsBadge() {
+    pendingCommentsCount = (await api.getPendingCommentsCount()).pending;
     const badge = document.getElementById('comments-badge');
-    if (badge) badge.textContent = pending;
+    if (badge) badge.textContent = pendingCommentsCount;
 }
@@ -4,39 +4,40 @@
 const MAP_CONFIG = {
     center: [45.0, 10.0],
     zoom: 3,
+    clusterMaxZoom: 7, // below this zoom, spots are drawn as server-side clusters
     tileUrl: 'https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png'
 };
+let clusterLayer = null;
+let mapRequest = 0, mapRefresh = Promise.resolve();
 
 async function initMap() {
     if (map) return;
     map = L.map('map', { zoomControl: false, attributionControl: false }).setView(MAP_CONFIG.center, MAP_CONFIG.zoom);
     L.tileLayer(MAP_CONFIG.tileUrl, { maxZoom: 19, attribution: '© OpenStreetMap contributors' }).addTo(map);
     L.control.zoom({ position: 'bottomright' }).addTo(map);
-    await loadSpots();
-    updateMapMarkers();
+    clusterLayer = L.layerGroup().addTo(map);
+    map.on('moveend', updateMapMarkers);
+    await loadSpots(); // also draws the viewport once the map exists
 }
 
-function updateMapMarkers() {
-    markers.forEach(m => map.removeLayer(m));
-    markers = [];
-    if (spotsData.length === 0) return;
-    
-    spotsData.forEach(spot => {
-        const customIcon = L.divIcon({
-            className: 'custom-marker',
-            html: `<div style="width:32px;height:32px;border-radius:50%;background:#18181b;border:2px solid white;display:flex;align-items:center;justify-content:center;box-shadow:0 2px 8px rgba(0,0,0,0.3);cursor:pointer">
-                <svg width="14" height="14" viewBox="0 0 24 24" fill="none" stroke="white" stroke-width="2">
-                    <path d="M23 19a2 2 0 0 1-2 2H3a2 2 0 0 1-2-2V8a2 2 0 0 1 2-2h4l2-3h6l2 3h4a2 2 0 0 1 2 2z"></path>
-                    <circle cx="12" cy="13" r="4"></circle>
-                </svg>
-            </div>`,
-            iconSize: [32, 32],
-            iconAnchor: [16, 16],
-            popupAnchor: [0, -16]
-        });
-        
-        const tags = spot.tags ? spot.tags.split(',').map(t => t.trim()) : [];
-        const popupContent = `<div style="min-width:200px;font-family:'Inter',sans-serif">
+function drawClusters(clusters) {
+    clusters.forEach(c => {
+        const size = 24 + Math.min(24, Math.round(Math.log2(c.count) * 4));
+        L.marker([c.lat, c.lon], {
+            icon: L.divIcon({
+                className: 'custom-marker',
+                html: `<div style="width:${size}px;height:${size}px;border-radius:50%;background:#18181b;border:2px solid white;display:flex;align-items:center;justify-content:center;box-shadow:0 2px 8px rgba(0,0,0,0.3);color:white;font:600 11px 'Inter',sans-serif">${c.count}</div>`,
+                iconSize: [size, size],
+                iconAnchor: [size / 2, size / 2]
+            })
+        }).on('click', () => map.setView([c.lat, c.lon], Math.min(map.getZoom() + 2, MAP_CONFIG.clusterMaxZoom)))
+          .addTo(clusterLayer);
+    });
+}
+
+function spotPopupContent(spot) {
+    const tags = spot.tags ? spot.tags.split(',').map(t => t.trim()) : [];
+    return `<div style="min-width:200px;font-family:'Inter',sans-serif">
             <div style="display:flex;align-items:center;gap:8px;margin-bottom:8px">
                 <h3 style="margin:0;font-size:14px;font-weight:600;color:#18181b">${spot.name}</h3>
                 <span style="display:flex;align-items:center;gap:2px;color:#f59e0b;font-size:12px;font-weight:500">
@@ -51,16 +52,55 @@ function updateMapMarkers() {
                 ${tags.map(tag => `<span style="padding:2px 6px;background:#f4f4f5;border:1px solid #e4e4e7;border-radius:4px;font-size:10px;color:#71717a;font-weight:500">${tag}</span>`).join('')}
             </div>
         </div>`;
-        
-        if (spot.latitude && spot.longitude) {
-            const marker = L.marker([spot.latitude, spot.longitude], { icon: customIcon })
-                .addTo(map).bindPopup(popupContent);
-            markers.push(marker);
-        }
+}
+
+// Below clusterMaxZoom the viewport is drawn as server-side clusters, above it as
+// the markers of its spots (compact map feed); each move refetches the viewport.
+// Details are fetched when a popup opens.
+function updateMapMarkers() {
+    mapRefresh = drawViewport(++mapRequest);
+    return mapRefresh;
+}
+
+async function drawViewport(request) {
+    const bounds = map.getBounds(), zoom = map.getZoom();
+    const clustered = zoom < MAP_CONFIG.clusterMaxZoom;
+    let items = [];
+    try {
+        items = clustered ? await api.getSpotClusters(bounds, zoom) : await api.getSpotMap(bounds);
+    } catch (error) {
+        console.error('Error loading map:', error);
+    }
+    if (request !== mapRequest) return; // superseded by a later move
+    clusterLayer.clearLayers();
+    markers.forEach(m => map.removeLayer(m));
+    markers = [];
+    if (clustered) {
+        drawClusters(items);
+        return;
+    }
+    
+    const customIcon = L.divIcon({
+        className: 'custom-marker',
+        html: `<div style="width:32px;height:32px;border-radius:50%;background:#18181b;border:2px solid white;display:flex;align-items:center;justify-content:center;box-shadow:0 2px 8px rgba(0,0,0,0.3);cursor:pointer">
+            <svg width="14" height="14" viewBox="0 0 24 24" fill="none" stroke="white" stroke-width="2">
+                <path d="M23 19a2 2 0 0 1-2 2H3a2 2 0 0 1-2-2V8a2 2 0 0 1 2-2h4l2-3h6l2 3h4a2 2 0 0 1 2 2z"></path>
+                <circle cx="12" cy="13" r="4"></circle>
+            </svg>
+        </div>`,
+        iconSize: [32, 32],
+        iconAnchor: [16, 16],
+        popupAnchor: [0, -16]
     });
     
-    if (markers.length > 0) {
-        const group = new L.featureGroup(markers);
-        map.fitBounds(group.getBounds().pad(0.3));
-    }
+    items.forEach(spot => {
+        const marker = L.marker([spot.latitude, spot.longitude], { icon: customIcon })
+            .addTo(map).bindPopup('…');
+        marker.spotId = spot.id;
+        marker.on('popupopen', async () => {
+            const details = spotsData.find(s => s.id === spot.id) || await api.getSpot(spot.id);
+            marker.setPopupContent(spotPopupContent(details));
+        });
+        markers.push(marker);
+    });
 }